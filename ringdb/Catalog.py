@@ -0,0 +1,71 @@
+import pandas as pd
+
+
+class URLCatalog:
+    """
+    Dictionary indexes built once from the metadb url tables, so that the
+    lookups done on every strain(), psd() and posteriors() call are O(1)
+    instead of boolean-mask scans over the DataFrames.
+
+    Indexes:
+        detectors:       event -> list of detectors with strain data
+        strain_url:      (event, detector, duration) -> url
+        catalog:         event -> catalog of the posterior release
+        posterior_url:   (event, cosmo) -> url
+        posterior_first: event -> first listed posterior url of the event
+        filename:        url -> filename of the file served at url
+        url_events:      url -> list of events served by url
+        psd_url:         event -> url of the separate PSD file (GWTC-1)
+    """
+    def __init__(self, posterior_url_df=None, strain_url_df=None, psd_url_df=None):
+        self.detectors = {}
+        self.strain_url = {}
+        self.catalog = {}
+        self.posterior_url = {}
+        self.posterior_first = {}
+        self.filename = {}
+        self.url_events = {}
+        self.psd_url = {}
+
+        if strain_url_df is not None:
+            self.index_strain_urls(strain_url_df)
+        if posterior_url_df is not None:
+            self.index_posterior_urls(posterior_url_df)
+        if psd_url_df is not None:
+            self.index_psd_urls(psd_url_df)
+
+    def index_strain_urls(self, strain_url_df):
+        for event, detector, duration, url in zip(strain_url_df.Event, strain_url_df.Detector,
+                                                  strain_url_df.Duration, strain_url_df.Url):
+            detectors = self.detectors.setdefault(event, [])
+            if detector not in detectors:
+                detectors.append(detector)
+            self.strain_url.setdefault((event, detector, float(duration)), url)
+
+    def index_posterior_urls(self, posterior_url_df):
+        for event, cosmo, url, filename, catalog in zip(posterior_url_df.event, posterior_url_df.cosmo,
+                                                        posterior_url_df.url, posterior_url_df.filename,
+                                                        posterior_url_df.catalog):
+            self.catalog.setdefault(event, catalog)
+            self.posterior_first.setdefault(event, url)
+            self.filename.setdefault(url, filename)
+            events = self.url_events.setdefault(url, [])
+            if event not in events:
+                events.append(event)
+            # Rows without a cosmo flag serve both choices
+            for flag in ([True, False] if pd.isnull(cosmo) else [self.as_bool(cosmo)]):
+                self.posterior_url.setdefault((event, flag), url)
+
+    def index_psd_urls(self, psd_url_df):
+        for event, url in zip(psd_url_df.event, psd_url_df.url):
+            self.psd_url.setdefault(event, url)
+
+    @staticmethod
+    def as_bool(value):
+        if isinstance(value, str):
+            return value.strip().lower() == 'true'
+        return bool(value)
+
+    @property
+    def events(self):
+        return list(self.detectors.keys())
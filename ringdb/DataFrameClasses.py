@@ -7,12 +7,12 @@ detectors.
 __all__ = ['Series', 'TimeSeries', 'FrequencySeries', 'Data',
            'AutoCovariance', 'PowerSpectrum']
 
-from pylab import *
-import scipy.signal as sig
-import lal
-import scipy.linalg as sl
-from scipy.interpolate import interp1d
-import scipy.signal as ss
+# scipy and lal are slow to import, so they are only imported inside the
+# methods that need them
+import numpy as np
+from numpy import arange, argmin, dot, iscomplex, linalg, mean, roll, sqrt, vectorize
+from numpy.fft import ifftshift
+import inspect
 import pandas as pd
 import h5py
 import os
@@ -111,6 +111,7 @@ class Series(pd.Series):
         new_series : Series
             interpolated :class:`Series`
         """
+        from scipy.interpolate import interp1d
         kws = self._DEF_INTERP_KWS.copy()
         kws.update(**kwargs)
         if any(iscomplex(self.values)):
@@ -120,23 +121,66 @@ class Series(pd.Series):
         else:
             interp_func = interp1d(self.index, self.values, **kws)
             interp = interp_func(new_index)
-        info = {a: getattr(self, a) for a in getattr(self, '_metadata', [])}
-        return self._constructor(interp, index=new_index, **info)
+        return self._constructor(interp, index=new_index, **self._info())
     interpolate_to_index.__doc__ = interpolate_to_index.__doc__.format(_DEF_INTERP_KWS)
 
+    def _info(self):
+        # Metadata passed on to the constructor of derived series; private
+        # (underscored) metadata is pandas' or describes the index
+        return {a: getattr(self, a) for a in getattr(self, '_metadata', [])
+                if not a.startswith('_')}
+
 
 class TimeSeries(Series):
     """ A container for time series data based on `pandas.Series`;
     the index should contain time stamps for uniformly-sampled data.
+
+    Instead of an index, the start time ``t0`` and sampling interval ``dt``
+    can be given, in which case the series is *compact*: its index is a
+    :class:`pandas.RangeIndex` of sample numbers, and the time stamps
+    ``t0 + dt*index`` are only computed on demand (see :attr:`time` and
+    :meth:`materialize`). Positional slicing (``iloc``), :meth:`crop`,
+    :meth:`interpolate_to_index`, :meth:`Data.condition` and
+    :meth:`AutoCovariance.whiten` all keep a series compact. Note that
+    arithmetic between two compact series aligns them by sample number.
     """
 
+    _metadata = Series._metadata + ['_t0', '_dt']
+    _t0 = None
+    _dt = None
+
+    def __init__(self, *args, t0=None, dt=None, **kwargs):
+        if (dt is not None) and (kwargs.get('index') is None):
+            data = args[0] if len(args) > 0 else kwargs['data']
+            kwargs['index'] = pd.RangeIndex(len(data))
+        super(TimeSeries, self).__init__(*args, **kwargs)
+        if dt is not None:
+            self._t0 = t0 or 0.0
+            self._dt = dt
+
     @property
     def _constructor(self):
         return TimeSeries
 
+    @property
+    def is_compact(self) -> bool:
+        """Whether the time stamps are implicit, ``t0 + dt*index``."""
+        return self._dt is not None
+
+    def _index_kws(self):
+        # Keyword arguments giving a new series the same time stamps
+        return dict(index=self.index, t0=self._t0, dt=self._dt)
+
+    def _first_time(self):
+        return self._t0 + self._dt*self.index[0] if self.is_compact else self.index[0]
+
     @property
     def delta_t(self) -> float:
         """Sampling time interval."""
+        if self.is_compact:
+            if isinstance(self.index, pd.RangeIndex):
+                return self._dt*self.index.step
+            return self._dt*(self.index[1] - self.index[0])
         return self.index[1] - self.index[0]
 
     @property
@@ -158,8 +202,58 @@ class TimeSeries(Series):
     @property
     def time(self) -> pd.Index:
         """Time stamps."""
+        if self.is_compact:
+            return pd.Index(self._t0 + self._dt*np.asarray(self.index, dtype=float))
         return self.index
 
+    def materialize(self):
+        """Returns the series with its time stamps as an explicit index.
+        """
+        if not self.is_compact:
+            return self
+        return self._constructor(self.values, index=self.time, name=self.name,
+                                 **self._info())
+
+    def compact(self):
+        """Returns the series with implicit time stamps, assuming it is
+        uniformly sampled.
+        """
+        if self.is_compact:
+            return self
+        return self._constructor(self.values, t0=self.index[0], dt=self.delta_t,
+                                 name=self.name, **self._info())
+
+    def crop(self, t_start=None, t_end=None):
+        """Select the samples with ``t_start <= t < t_end``; for a compact
+        series this is a positional slice and no time stamps are computed.
+
+        Arguments
+        ---------
+        t_start : float
+            start time, defaults to the start of the series.
+        t_end : float
+            end time (excluded), defaults to the end of the series.
+
+        Returns
+        -------
+        new_series : TimeSeries
+            cropped series
+        """
+        if self.is_compact and isinstance(self.index, pd.RangeIndex):
+            t_first, dt, n = self._first_time(), self.delta_t, len(self)
+            # index of the first sample at or after t, rounding off float noise
+            first = lambda t: int(np.ceil(np.round((t - t_first)/dt, 6)))
+            i0 = 0 if t_start is None else min(max(first(t_start), 0), n)
+            i1 = n if t_end is None else min(max(first(t_end), i0), n)
+            return self.iloc[i0:i1]
+        time = self.time.values
+        keep = np.ones(len(self), dtype=bool)
+        if t_start is not None:
+            keep &= time >= t_start
+        if t_end is not None:
+            keep &= time < t_end
+        return self[keep]
+
     def interpolate_to_index(self, time=None, t0=None, duration=None,
                              fsamp=None, **kws):
         """Reinterpolate the :class:`TimeSeries` to new index. Inherits from
@@ -182,24 +276,35 @@ class TimeSeries(Series):
         Returns
         -------
         new_series : TimeSeries
-            interpolated series
+            interpolated series; compact if this series is compact and no
+            ``time`` array was given
         """
+        # a compact series is interpolated on its sample numbers, so its
+        # time stamps are never computed
+        t_min, t_max = (self._t0 + self._dt*self.index.min(), self._t0 + self._dt*self.index.max()) \
+            if self.is_compact else (self.time.min(), self.time.max())
+        compact = self.is_compact and (time is None)
         if time is None:
-            t0 = t0 or self.time.min()
-            duration = duration or (self.time.max() - t0)
+            t0 = t0 or t_min
+            duration = duration or (t_max - t0)
             fsamp = fsamp or self.fsamp
 
             # Create the timing array
             time = np.arange(0.0, duration, 1/fsamp) + t0
 
             # Make sure we don't include points outside of the index
-            if time.max() > self.time.max():
-                time = time[time <= self.time.max()]
+            if time.max() > t_max:
+                time = time[time <= t_max]
         elif t0 is not None:
             # Use the time array for the delta_t and duration, but set 
             # the t0 provided
             time = time - time[0] + t0
-        return super(TimeSeries, self).interpolate_to_index(time, **kws)
+        if not self.is_compact:
+            return super(TimeSeries, self).interpolate_to_index(time, **kws)
+        new = super(TimeSeries, self).interpolate_to_index((np.asarray(time) - self._t0)/self._dt, **kws)
+        if compact:
+            return self._constructor(new.values, t0=time[0], dt=1/fsamp, name=self.name, **self._info())
+        return self._constructor(new.values, index=time, name=self.name, **self._info())
 
 
 class FrequencySeries(Series):
@@ -280,7 +385,7 @@ class Data(TimeSeries):
         optional additional information, e.g., to identify data provenance.
     """
 
-    _metadata = ['ifo', 'info']
+    _metadata = ['ifo', 'info', '_t0', '_dt']
 
     def __init__(self, *args, ifo=None, info=None,  **kwargs):
         if ifo is not None:
@@ -295,9 +400,10 @@ class Data(TimeSeries):
         return Data
 
     @property
-    def detector(self) -> lal.Detector:
+    def detector(self) -> "lal.Detector":
         """:mod:`lal` object containing detector information.
         """
+        import lal
         if self.ifo:
             d = lal.cached_detector_by_prefix[self.ifo]
         else:
@@ -336,18 +442,27 @@ class Data(TimeSeries):
         cond_data : Data
             conditioned data object.
         """
+        import scipy.signal as sig
+        import scipy.signal as ss
         raw_data = self.values
-        raw_time = self.index.values
+        # a compact series keeps its time stamps implicit: only the shift
+        # of the first sample is tracked
+        raw_time = None if self.is_compact else self.index.values
+        shift = 0
 
         decimate_kws = decimate_kws or {}
 
         if t0 is not None:
             ds = int(ds or 1)
-            i = argmin(abs(raw_time - t0))
-            raw_time = roll(raw_time, -(i % ds))
+            if raw_time is None:
+                i = int(np.clip(round((t0 - self._first_time())/self.delta_t), 0, len(self) - 1))
+            else:
+                i = argmin(abs(raw_time - t0))
+                raw_time = roll(raw_time, -(i % ds))
             raw_data = roll(raw_data, -(i % ds))
+            shift = i % ds
 
-        fny = 0.5/(raw_time[1] - raw_time[0])
+        fny = 0.5/self.delta_t
         # Filter
         if flow and not fhigh:
             b, a = sig.butter(4, flow/fny, btype='highpass', output='ba')
@@ -390,12 +505,17 @@ class Data(TimeSeries):
         istart = int(round(trim*N))
         iend = int(round((1-trim)*N))
 
-        cond_time = cond_time[istart:iend]
         cond_data = cond_data[istart:iend]
 
         if remove_mean:
-            cond_data -= mean(cond_data)
+            # not in place, the raw data may be a read-only memory map
+            cond_data = cond_data - mean(cond_data)
 
+        if raw_time is None:
+            step = ds if (ds and ds > 1) else 1
+            return Data(cond_data, t0=self._first_time() + self.delta_t*(shift + istart*step),
+                        dt=self.delta_t*step, ifo=self.ifo)
+        cond_time = cond_time[istart:iend]
         return Data(cond_data, index=cond_time, ifo=self.ifo)
 
 
@@ -447,6 +567,7 @@ class PowerSpectrum(FrequencySeries):
         psd : PowerSpectrum
             power specturm estimate.
         """
+        import scipy.signal as sig
         fs = kws.pop('fs', 1/getattr(data, 'delta_t', 1))
         kws['nperseg'] = kws.get('nperseg', fs)  # default to 1s segments
         kws['average'] = kws.get('average', 'median') # default to median-averaged, not mean-averaged to handle outliers.
@@ -585,6 +706,7 @@ class AutoCovariance(TimeSeries):
         acf : AutoCovariance
             estimate of the autocovariance function.
         """
+        import scipy.signal as sig
         dt = getattr(d, 'delta_t', delta_t)
         n = n or len(d)
         if method.lower() == 'td':
@@ -616,6 +738,7 @@ class AutoCovariance(TimeSeries):
     def matrix(self):
         """Covariance matrix built from ACF, :math:`C_{ij} = \\rho(|i-j|)`.
         """
+        import scipy.linalg as sl
         return sl.toeplitz(self)
 
     @property
@@ -650,6 +773,7 @@ class AutoCovariance(TimeSeries):
             signal-to-noise ratio
         """
 
+        import scipy.linalg as sl
         if y is None: y = x
         ow_x = sl.solve_toeplitz(self.iloc[:len(x)], x)
         return dot(ow_x, y)/sqrt(dot(x, ow_x))
@@ -667,6 +791,7 @@ class AutoCovariance(TimeSeries):
         w_data : Data
             whitened data.
         """
+        import scipy.linalg as sl
         if isinstance(data, TimeSeries):
             assert (data.delta_t == self.delta_t)
         # whiten stretch of data using Cholesky factor
@@ -674,7 +799,7 @@ class AutoCovariance(TimeSeries):
         w_data = sl.solve_triangular(L, data, lower=True)
         # return same type as input
         if isinstance(data, Data):
-            w_data = Data(w_data, index=data.index, ifo=data.ifo)
+            w_data = Data(w_data, ifo=data.ifo, **data._index_kws())
         elif isinstance(data, TimeSeries):
-            w_data = TimeSeries(w_data, index=data.index)
+            w_data = TimeSeries(w_data, **data._index_kws())
         return w_data
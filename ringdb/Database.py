@@ -1,4 +1,5 @@
 import os
+import time
 import subprocess
 from . import DataFrameClasses as ringdown
 from . import File
@@ -16,6 +17,11 @@ except ImportError:
 from .File import *
 from .StrainDatabase import *
 from .PosteriorDatabase import *
+from .Prefetch import Prefetcher
+from .Catalog import URLCatalog
+from .Precision import DtypePolicy
+from .ObjectCache import ObjectCache
+from .WorkQueue import WorkQueue
 from . import File
 from . import StrainDatabase
 from . import PosteriorDatabase
@@ -23,7 +29,7 @@ from . import PosteriorDatabase
 from . import metadb
 
 class Database:
-    def __init__(self, data_folder, posterior_urls=None, strain_urls=None, psd_urls=None):
+    def __init__(self, data_folder, posterior_urls=None, strain_urls=None, psd_urls=None, dtype=None, cache_bytes=None, column_cache=False):
         if data_folder is not None:
             if data_folder[-1] == "/":
                 data_folder
@@ -36,21 +42,35 @@ class Database:
             self.strain_folder = None
 
         # Pull the default url data for all the posteriors, strains and psds. 
-        self.posterior_urls = None
+        self.posterior_urls = posterior_urls
         if posterior_urls is None:
             posterior_url_path = pkg_resources.open_text(metadb, 'posterior_urls.csv')
             self.posterior_urls = pd.read_csv(posterior_url_path)
 
-        self.strain_urls = None
+        self.strain_urls = strain_urls
         if strain_urls is None:
             strain_url_path = pkg_resources.open_text(metadb, 'strain_urls.csv')
             self.strain_urls = pd.read_csv(strain_url_path)
 
-        self.psd_urls = None
+        self.psd_urls = psd_urls
         if psd_urls is None:
             psd_url_path = pkg_resources.open_text(metadb, 'psd_urls.csv')
             self.psd_urls = pd.read_csv(psd_url_path)
 
+        # Index the url tables once, so every query is a dictionary lookup
+        self.catalog = URLCatalog(self.posterior_urls, self.strain_urls, self.psd_urls)
+
+        # What strain and posteriors are loaded as, e.g. dtype='compact' for
+        # float32 samples and categorical waveform columns (see DtypePolicy)
+        self.dtype = DtypePolicy.resolve(dtype)
+
+        # Products already loaded, up to cache_bytes of arrays (no cache if None)
+        self.cache = ObjectCache(cache_bytes) if cache_bytes else None
+
+        # Keep a columnar copy of each posterior table on disk for fast
+        # repeated loads (see PosteriorDatabase.write_cache)
+        self.column_cache = column_cache
+
     def initialize(self, data_folder=None):
         # This will overwrite the default folder if folder is provided:
         if data_folder is not None:
@@ -68,8 +88,8 @@ class Database:
                 subprocess.run(["mkdir", folder])
 
         # This will create the databases
-        self.PosteriorDB = PosteriorDatabase(self.posterior_folder, self.posterior_urls, self.psd_urls, self.strain_urls)
-        self.StrainDB = StrainDatabase(self.strain_folder, self.strain_urls)
+        self.PosteriorDB = PosteriorDatabase(self.posterior_folder, self.posterior_urls, self.psd_urls, self.strain_urls, catalog=self.catalog, dtypes=self.dtype, column_cache=self.column_cache)
+        self.StrainDB = StrainDatabase(self.strain_folder, self.strain_urls, catalog=self.catalog, dtypes=self.dtype)
 
     def update_posterior_schema(self, schema_addition):
         self.PosteriorDB.schema.update(schema_addition)
@@ -80,8 +100,244 @@ class Database:
     def event(self, eventname):
         return Event(eventname, self)
 
+    def close(self):
+        """
+        Closes the hdf5 files of this database's folders held open by the
+        posterior and strain databases, leaving those of other databases
+        sharing the pool open
+        """
+        self.PosteriorDB.pool.close(folder=self.posterior_folder)
+        self.StrainDB.pool.close(folder=self.strain_folder)
+        if self.cache is not None:
+            self.cache.clear()
+
+    def cached(self, event, product, kwargs, load):
+        """
+        Serves a product of an event from the in-memory cache, loading it
+        with load() on a miss. Without a cache this just calls load().
+        """
+        if self.cache is None:
+            return load()
+        return self.cache.get(event, product, kwargs, load)
+
+    def cache_info(self):
+        """
+        Returns the hits, misses, evictions, number of items and bytes of
+        the in-memory product cache, or None if there is no cache
+        """
+        return None if self.cache is None else self.cache.info()
+
     def event_list(self):
-        return list(self.strain_urls.Event.unique())
+        return self.catalog.events
+
+    def prefetch(self, events=None, products=("strain", "psd", "posteriors"), workers=8, per_host=4, duration=32.0):
+        """
+        Downloads the requested products for many events at once so that
+        later calls to event.strain(), event.psd() and event.posteriors()
+        are served from disk.
+
+        Downloads run on a thread pool, with at most per_host concurrent
+        downloads from any one server. Archives that serve several events
+        are only downloaded once.
+
+        Args:
+            events (None or list of strings):
+                Events to prefetch, defaults to every event in the catalog
+            products (tuple of strings):
+                Any of 'strain', 'psd' and 'posteriors'
+            workers (int):
+                Number of concurrent downloads
+            per_host (int):
+                Maximum number of concurrent downloads from the same host
+            duration (float):
+                Duration of the strain files to fetch
+
+        Returns:
+            dict: summary with the number of downloads completed, the
+            failures, the bytes downloaded, elapsed time and throughput
+        """
+        if events is None:
+            events = self.event_list()
+        prefetcher = Prefetcher(self, workers=workers, per_host=per_host)
+        return prefetcher.run(events, products=products, duration=duration)
+
+    def posteriors(self, events=None, columns=None, workers=1, as_arrays=False):
+        """
+        Loads the posterior samples of many events and stacks them into
+        one table, with an 'event' column saying which event each sample
+        belongs to.
+
+        Events are loaded concurrently in a process pool. Each column of
+        the result is allocated once and filled event by event. A column
+        that some events don't have is filled with NaN (or None) for those
+        events. Events that fail to load are reported and left out.
+
+        Args:
+            events (None or list of strings):
+                Events to load, defaults to every event with posteriors
+                in the catalog
+            columns (None or list of strings):
+                Only read these parameters. Defaults to every parameter.
+            workers (int):
+                Number of processes loading events; 1 loads them here
+            as_arrays (bool):
+                Return a dictionary of numpy arrays instead of a DataFrame
+
+        Returns:
+            pd.DataFrame (or dict of np.ndarray): the stacked samples
+        """
+        if events is None:
+            events = [e for e in self.event_list() if e in self.catalog.posterior_first]
+        initargs = (self.data_folder, self.posterior_urls, self.strain_urls, self.psd_urls, self.dtype, self.column_cache)
+        tasks = [(event, columns) for event in events]
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_posterior_worker,
+                                     initargs=initargs) as executor:
+                results = list(executor.map(_load_event_posteriors, tasks))
+        else:
+            results = [_load_event_posteriors(task, database=self) for task in tasks]
+
+        loaded = []
+        for event, arrays, error in results:
+            if error is None:
+                loaded.append((event, arrays))
+            else:
+                print(f"Failed {event}: {error}")
+        return stack_columns(loaded, categorical=self.dtype.categorical, as_arrays=as_arrays)
+
+    def compute_peak_times(self, events=None, workers=1, precision=None, max_failures=3, stale_after=6*3600):
+        """
+        Calculates the peak times (PeakTimes/) of many events, as a batch job
+        that several processes or nodes sharing the data folder can run at
+        the same time: events are handed out by a persistent work queue
+        (PeakTimes/.queue.sqlite, see WorkQueue), so each event is only
+        worked on once, and a job that is stopped picks up where it was.
+
+        Args:
+            events (None or list of strings):
+                Events to calculate, defaults to every event with posteriors
+                in the catalog
+            workers (int):
+                Number of processes working through the queue here; 1 works
+                through it in this process
+            precision (None or float):
+                Tolerance of the adaptive peak time search, see
+                PosteriorDatabase.calculate_t_peaks
+            max_failures (int):
+                Failed events are retried until they failed this many times
+            stale_after (float):
+                Seconds after which an event still marked as running (by a
+                process that died) is handed out again
+
+        Returns:
+            pd.DataFrame: the queue status of each event, with the worker,
+            start and finish times, seconds taken, attempts, failures and
+            last error
+        """
+        if events is None:
+            events = [e for e in self.event_list() if e in self.catalog.posterior_first]
+        os.makedirs(f"{self.posterior_folder}/PeakTimes", exist_ok=True)
+        queue = WorkQueue(f"{self.posterior_folder}/PeakTimes")
+        queue.add(events)
+        # Finished events whose posterior file changed since it was recorded
+        # are queued again (files registered anew already were, by
+        # PosteriorDatabase.register_file)
+        done = queue.status(events)
+        done = done.event[done.status == 'done']
+        queue.reset([e for e in done if os.path.exists(self.PosteriorDB.event_path(e))
+                     and not self.PosteriorDB.manifest.contains(e, 'posteriors')])
+
+        initargs = (self.data_folder, self.posterior_urls, self.strain_urls, self.psd_urls, self.dtype, self.column_cache)
+        task = (queue.folder, list(events), precision, max_failures, stale_after)
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_posterior_worker,
+                                     initargs=initargs) as executor:
+                list(executor.map(_drain_peak_queue, [task]*workers))
+        else:
+            _drain_peak_queue(task, database=self)
+
+        status = queue.status(events)
+        print(f"Peak times: {(status.status == 'done').sum()} of {len(status)} events done, "
+              f"{(status.status == 'failed').sum()} failed")
+        return status
+
+
+# Each process loading posteriors for Database.posteriors keeps its own
+# Database, built once when the process starts
+_posterior_worker_db = None
+
+def _init_posterior_worker(data_folder, posterior_urls, strain_urls, psd_urls, dtype, column_cache):
+    global _posterior_worker_db
+    _posterior_worker_db = Database(data_folder, posterior_urls, strain_urls, psd_urls, dtype=dtype, column_cache=column_cache)
+    _posterior_worker_db.initialize()
+
+def _load_event_posteriors(task, database=None):
+    # (database is given when loading in the calling process)
+    event, columns = task
+    database = database if database is not None else _posterior_worker_db
+    try:
+        df = database.PosteriorDB.posteriors(event, columns=columns)
+        return event, {column: df[column].to_numpy() for column in df.columns}, None
+    except Exception as e:
+        return event, None, repr(e)
+
+def _drain_peak_queue(task, database=None):
+    # Claims events from the peak time queue until none of events is left
+    queue_folder, events, precision, max_failures, stale_after = task
+    database = database if database is not None else _posterior_worker_db
+    queue = WorkQueue(queue_folder)
+    while True:
+        event = queue.claim(events, max_failures=max_failures, stale_after=stale_after)
+        if event is None:
+            return
+        start = time.time()
+        try:
+            database.PosteriorDB.posteriors(event, peaks=True, precision=precision)
+        except Exception as e:
+            print(f"Failed {event}: {e!r}")
+            queue.fail(event, time.time() - start, repr(e))
+        except BaseException:
+            queue.release(event)
+            raise
+        else:
+            queue.finish(event, time.time() - start)
+
+def stack_columns(loaded, categorical=False, as_arrays=False):
+    """
+    Stacks the columns of several events, given as a list of (event,
+    dictionary of arrays), into one array per column plus an 'event'
+    column, allocating each of them once.
+    """
+    lengths = [len(next(iter(arrays.values()))) if len(arrays) != 0 else 0 for _, arrays in loaded]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+    columns = list(dict.fromkeys(column for _, arrays in loaded for column in arrays))
+
+    stacked = {}
+    for column in columns:
+        present = [arrays[column] for _, arrays in loaded if column in arrays]
+        dtype = np.result_type(*present)
+        complete = len(present) == len(loaded)
+        if (not complete) and (dtype.kind not in 'fcO'):
+            dtype = np.dtype(object) if dtype.kind in 'SU' else np.dtype('float64')
+        values = np.empty(offsets[-1], dtype=dtype)
+        if not complete:
+            values[:] = np.nan if dtype.kind in 'fc' else None
+        for (_, arrays), start, stop in zip(loaded, offsets[:-1], offsets[1:]):
+            if column in arrays:
+                values[start:stop] = arrays[column]
+        stacked[column] = values
+
+    codes = np.repeat(np.arange(len(loaded), dtype=np.int32), lengths)
+    stacked['event'] = pd.Categorical.from_codes(codes, [event for event, _ in loaded])
+    if categorical:
+        for column in ['waveform_name', 'waveform_code']:
+            if column in stacked:
+                stacked[column] = pd.Categorical(stacked[column])
+    if as_arrays:
+        return {column: np.asarray(values) for column, values in stacked.items()}
+    return pd.DataFrame(stacked, copy=False)
 
 
 class Event:
@@ -95,11 +351,46 @@ class Event:
         """
         Returns a dataframe of the posterior samples of the event
 
+        Args:
+            columns (None or list of strings):
+                Only read these parameters, e.g. ['final_mass', 'final_spin', 'ra',
+                'dec', 'geocent_time', 'psi']. Defaults to every parameter.
+            peaks (bool):
+                Also return the peak times of each sample
+            precision (None or float):
+                Tolerance in seconds of the adaptive peak time search,
+                used if peak times still need calculating (see
+                PosteriorDatabase.calculate_t_peaks)
+            samples (None, int or list of ints):
+                Only return these samples (the first samples ones if an
+                int), so only their peak times are calculated
+
         Returns:
             pd.DataFrame: Posterior samples of the event with each row
             being a posterior sample and the columns the parameter
         """
-        return self.PD_ref.posteriors(self.name, **kwargs)
+        return self.DB_ref.cached(self.name, 'posteriors', kwargs,
+                                  lambda: self.PD_ref.posteriors(self.name, **kwargs))
+
+    def iter_posteriors(self, chunk_size=100000, columns=None, structured=False):
+        """
+        Iterates over the posterior samples of the event in chunks, only
+        holding one chunk in memory at a time
+
+        Args:
+            chunk_size (int):
+                Number of samples per chunk
+            columns (None or list of strings):
+                Only read these parameters. Defaults to every parameter.
+            structured (bool):
+                Yield numpy structured arrays instead of DataFrames
+
+        Returns:
+            iterator of pd.DataFrame: consecutive chunks of the samples,
+            indexed by the sample number within the whole posterior
+        """
+        return self.PD_ref.iter_posteriors(self.name, chunk_size=chunk_size, columns=columns,
+                                           structured=structured)
 
     def psd(self, detector=None):
         """
@@ -128,9 +419,10 @@ class Event:
             If detector is specified as a string (e.g. detector='H1'):
                 A ringdown.PowerSpectrum object containing the detector PSD
         """
-        return self.PD_ref.psd(self.name, detector=detector)
+        return self.DB_ref.cached(self.name, 'psd', {'detector': detector},
+                                  lambda: self.PD_ref.psd(self.name, detector=detector))
 
-    def strain(self, detectors=None, duration=32.0):
+    def strain(self, detectors=None, duration=32.0, t_start=None, t_end=None, around=None, width=None, mmap=False, compact=False):
         """
         Returns the strain for all detectors or a single detector 
         if specified.
@@ -151,6 +443,28 @@ class Event:
                 but as of now it probably will not overwrite what you have.
                 This is definitely on the next TODO.
 
+            t_start, t_end (None or float):
+                Only read the samples with t_start <= t < t_end (GPS seconds),
+                instead of the whole file.
+
+            around, width (None or float):
+                Alternatively, only read the window of the given width (in 
+                seconds) centered on the GPS time around.
+
+            mmap (bool):
+                If True, the strain is a read-only numpy.memmap into the
+                event file instead of an in-memory copy. Files downloaded
+                with mmap=True are stored uncompressed and contiguous so
+                they can be mapped; for any other file this falls back
+                to reading the samples.
+
+            compact (bool):
+                If True, the Data objects keep their time stamps implicit
+                (t0 + dt*index, with a RangeIndex of sample numbers)
+                instead of holding a float64 index as large as the strain
+                itself. Use .time for the time stamps, .crop(t_start, t_end)
+                to select times and .materialize() for a time index.
+
         Returns:
             A dictionary containing ringdown.PowerSpectrum objects for
             each detector's PSD.
@@ -162,7 +476,10 @@ class Event:
             If detector is specified as a string (e.g. detector='H1'):
                 A ringdown.PowerSpectrum object containing the detector PSD
         """
-        return self.SD_ref.strain(self.name, detectors=detectors, duration=duration)
+        kwargs = dict(detectors=detectors, duration=duration, t_start=t_start, t_end=t_end,
+                      around=around, width=width, mmap=mmap, compact=compact)
+        return self.DB_ref.cached(self.name, 'strain', kwargs,
+                                  lambda: self.SD_ref.strain(self.name, **kwargs))
 
     def read_posterior_file(self, h5path, datatype='array', attr_name=None, detectors=None, approximant=None, replacement_dict=None):
         """
@@ -215,14 +532,14 @@ class Event:
                 file = self.PD_ref.event_path(self.name)
                 new_replacement_dict = replacement_dict.copy()
                 new_replacement_dict['detector'] = ifo
-                with h5py.File(file, 'r') as f:
+                with self.PD_ref.pool.borrow(file) as f:
                     result[ifo] = self.PD_ref.read_data_from_file(f, scheme, new_replacement_dict)
         else:
             scheme = {'type': datatype, 'name': attr_name, 'path': h5path}
             file = self.PD_ref.event_path(self.name)
-            with h5py.File(file, 'r') as f:
-                print(scheme)
-                print(replacement_dict)
+            print(scheme)
+            print(replacement_dict)
+            with self.PD_ref.pool.borrow(file) as f:
                 result = self.PD_ref.read_data_from_file(f, scheme, replacement_dict)
         return result
 
@@ -270,15 +587,15 @@ class Event:
             result = {}
             for ifo in detectors:
                 scheme = {'type': datatype, 'name': attr_name, 'path': h5path}
-                file = filepath = f"{self.folder}/{event}.hdf5"
+                file = f"{self.SD_ref.folder}/{self.name}.hdf5"
                 new_replacement_dict = replacement_dict.copy()
                 new_replacement_dict['detector'] = ifo
-                with h5py.File(file, 'r') as f:
+                with self.SD_ref.pool.borrow(file) as f:
                     result[ifo] = self.SD_ref.read_data_from_file(f, scheme, new_replacement_dict)
         else:
             scheme = {'type': datatype, 'name': attr_name, 'path': h5path}
-            file = filepath = f"{self.folder}/{event}.hdf5"
-            with h5py.File(file, 'r') as f:
+            file = f"{self.SD_ref.folder}/{self.name}.hdf5"
+            with self.SD_ref.pool.borrow(file) as f:
                 result = self.SD_ref.read_data_from_file(f, scheme, replacement_dict)
         return result
 
@@ -338,16 +655,91 @@ class Event:
             result = self.SD_ref.read_data(event=self.name, data_name=data_name, detector=detectors)
         return result
 
+    def read_schema(self, data_names, detectors=None, approximant=None):
+        """
+        Reads several entries of the strain and posterior schemas in one go,
+        opening each file once and resolving every path up front.
+
+        Example:
+        >> event.read_schema(['sample', 't0', 'dt', 'Npoints'], detectors=['H1', 'L1'])
+        >> ## {'sample': {'H1': array, 'L1': array}, 't0': {'H1': ..., 'L1': ...}, ...}
+
+        Names are looked up in the strain schema first, then the posterior
+        schema. Like the other schema readers, the files need to already
+        be downloaded.
+
+        Returns:
+            A dictionary labelled by data name. Entries whose path depends on
+            the detector hold a dictionary labelled by detector, unless
+            detectors is a single string.
+        """
+        strain_names = [name for name in data_names if name in self.SD_ref.schema]
+        posterior_names = [name for name in data_names if name not in self.SD_ref.schema]
+        unknown = [name for name in posterior_names if name not in self.PD_ref.schema]
+        if len(unknown) != 0:
+            raise KeyError(f"{unknown} are in neither the strain nor the posterior schema")
+
+        result = {}
+        if len(strain_names) != 0:
+            result.update(self.SD_ref.read_schema(self.name, strain_names, detectors=detectors))
+        if len(posterior_names) != 0:
+            result.update(self.PD_ref.read_schema(self.name, posterior_names, detectors=detectors, approximant=approximant))
+        return {name: result[name] for name in data_names}
+
     @property
     def t_peak_median_sample(self):
-        # Get posterior
-        df_times = self.posteriors(peaks=True)
-        df_times = df_times[df_times['t_peak'] != 0.0]
+        return self.peak_median_sample()
 
-        # Get the sample corresponding to median t_peak
-        df_times.sort_values('t_peak',ascending=True,inplace=True)
+    def peak_median_sample(self, max_samples=None, seed=0, n_bootstrap=100, precision=None):
+        """
+        The posterior sample with the median peak time (the lower of the two
+        middle samples for an even number), found by partitioning rather
+        than sorting
+
+        Args:
+            max_samples (None or int):
+                Only calculate peak times for a random subsample of this
+                many samples, for a quick look. Defaults to every sample.
+            seed (int):
+                Seed of the subsample and of the bootstrap, so repeated
+                calls use (and reuse the peak times of) the same samples
+            n_bootstrap (int):
+                Number of bootstrap resamples behind the error estimate of
+                a subsample
+            precision (None or float):
+                Tolerance of the adaptive peak time search, see posteriors
+
+        Returns:
+            pd.DataFrame: a single row with the event and the median sample
+            (just the event if no sample has a peak time). With
+            max_samples, also 't_peak_error', the bootstrap standard
+            deviation of the median peak time, and 'n_peak_samples', the
+            number of samples it is the median of.
+        """
+        rng = np.random.default_rng(seed)
+        samples = None
+        if max_samples is not None:
+            _, n = self.PD_ref.posterior_hash(self.name)
+            if max_samples < n:
+                samples = np.sort(rng.choice(n, max_samples, replace=False)).tolist()
+
+        # Get posterior, without the samples whose peak time failed
+        df_times = self.posteriors(peaks=True, samples=samples, precision=precision)
+        t_peak = df_times['t_peak'].values
+        valid = np.flatnonzero(np.isfinite(t_peak) & (t_peak != 0.0))
+        t_peak = t_peak[valid]
         new_dict = {'event': self.name}
-        new_dict.update(df_times[df_times.t_peak <= df_times.t_peak.median()].tail(1).squeeze().to_dict())
+        if len(t_peak) == 0:
+            print(f"No sample of {self.name} has a peak time")
+            return pd.DataFrame([new_dict])
+        k = (len(t_peak) - 1)//2
+
+        # Get the sample corresponding to median t_peak
+        new_dict.update(df_times.iloc[valid[np.argpartition(t_peak, k)[k]]].to_dict())
+        if max_samples is not None:
+            new_dict['t_peak_error'] = np.std([np.partition(t_peak[rng.integers(0, len(t_peak), len(t_peak))], k)[k]
+                                               for _ in range(n_bootstrap)])
+            new_dict['n_peak_samples'] = len(t_peak)
 
         return pd.DataFrame([new_dict])
 
@@ -1,13 +1,83 @@
 import os
 import subprocess
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import http.client
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
 import h5py
 
+def download(url, path, checksum=None, retries=5, backoff=1.0, timeout=60, chunk_size=2**20):
+    """
+    Streams url into path. The data is written to path + '.part' and only
+    moved into place once it is complete (and matches the checksum, if given),
+    so path either doesn't exist or holds the whole file.
+
+    A leftover .part file from an interrupted download is resumed with an
+    HTTP Range request. Failed attempts are retried with exponential backoff.
+
+    Args:
+        checksum (None or string):
+            Expected digest written as 'algorithm:hexdigest', e.g. 'md5:...'
+            or 'sha256:...' (the format zenodo reports checksums in).
+    """
+    part = path + ".part"
+    for attempt in range(retries + 1):
+        try:
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            request = urllib.request.Request(url)
+            if offset:
+                request.add_header("Range", f"bytes={offset}-")
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                # The server ignored the Range request, so start over
+                if offset and response.status != 206:
+                    offset = 0
+                expected = response.headers.get("Content-Length")
+                with open(part, "ab" if offset else "wb") as f:
+                    shutil.copyfileobj(response, f, chunk_size)
+                    written = f.tell() - offset
+            if (expected is not None) and (written < int(expected)):
+                raise http.client.IncompleteRead(b"", int(expected) - written)
+            break
+        except urllib.error.HTTPError as e:
+            # 416 means there is nothing left past what we already have
+            if (e.code == 416) and offset:
+                break
+            if (e.code < 500 and e.code != 429) or (attempt == retries):
+                raise
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            if attempt == retries:
+                raise
+        wait = backoff * 2**attempt
+        print(f"Download of {url} interrupted, retrying in {wait:.0f}s")
+        time.sleep(wait)
+
+    if checksum is not None:
+        algorithm, _, digest = checksum.rpartition(":")
+        if file_digest(part, algorithm or "md5") != digest.lower():
+            os.remove(part)
+            raise ValueError(f"Checksum mismatch for {url}, expected {checksum}")
+
+    os.replace(part, path)
+    return path
+
+def file_digest(path, algorithm="md5", chunk_size=2**20):
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
 class File:
     def __init__(self, rel_path):
         self.path = rel_path
         
     @classmethod
-    def from_url(cls, url, save_folder, new_filename=None):
+    def from_url(cls, url, save_folder, new_filename=None, checksum=None, retries=5):
         # Remove trailing "/" from path
         if save_folder[-1] == "/":
             save_folder = save_folder[0:-1]
@@ -17,18 +87,15 @@ class File:
         if folder_up != ".":
             if not os.path.exists(folder_up):
                 print(f"making folder {folder_up} since it doesn't exist")
-                subprocess.run(["mkdir", folder_up])
+                os.makedirs(folder_up, exist_ok=True)
                 
-        thefilepath = f"{save_folder}/{url.split('/')[-1]}"
-        # Downloading the file we have into the folder
+        # Save straight to the final name, the download is only moved
+        # into place once it is complete
+        filename = new_filename or os.path.basename(urlparse(url).path)
+        thefilepath = f"{save_folder}/{filename}"
         print(f"Downloading file from {url}")
-        #subprocess.run(["wget",url,"-P",save_folder])
-        subprocess.run(["curl",url,"--output",thefilepath])
-        file = cls(thefilepath)
-        if new_filename is not None:
-            file.rename(new_filename)
-            
-        return file
+        download(url, thefilepath, checksum=checksum, retries=retries)
+        return cls(thefilepath)
     
     def extract_here(self):
         file_type = self.path.split('.')[-1]
@@ -38,19 +105,65 @@ class File:
         if file_type == 'zip':
             subprocess.run(["unzip",self.path,"-d",folder])
     
+    @property
+    def archive_type(self):
+        file_type = self.path.split('.')[-1]
+        return file_type if file_type in ['tar', 'zip'] else None
+
+    @property
+    def members(self):
+        """
+        Names of the files stored inside a tar or zip archive
+        """
+        if self.archive_type == 'tar':
+            with tarfile.open(self.path) as archive:
+                return [m.name for m in archive.getmembers() if m.isfile()]
+        if self.archive_type == 'zip':
+            with zipfile.ZipFile(self.path) as archive:
+                return [name for name in archive.namelist() if not name.endswith('/')]
+        return []
+
+    def extract_members(self, destinations, chunk_size=2**20):
+        """
+        Streams only the requested members of a tar or zip archive straight
+        to their final location, without unpacking the rest of the archive.
+
+        Args:
+            destinations (dict):
+                archive member name -> path the member should be written to
+        """
+        def copy(source, dest):
+            with open(dest + ".part", "wb") as f:
+                shutil.copyfileobj(source, f, chunk_size)
+            os.replace(dest + ".part", dest)
+
+        if self.archive_type == 'tar':
+            with tarfile.open(self.path) as archive:
+                for member, dest in destinations.items():
+                    with archive.extractfile(member) as source:
+                        copy(source, dest)
+        elif self.archive_type == 'zip':
+            with zipfile.ZipFile(self.path) as archive:
+                for member, dest in destinations.items():
+                    with archive.open(member) as source:
+                        copy(source, dest)
+        else:
+            raise ValueError(f"{self.path} is not a tar or zip archive")
+        return [File(dest) for dest in destinations.values()]
+
     @property
     def exists(self):
         return os.path.exists(self.path)
         
     def delete(self):
         if self.path not in ['.', './', '/']:
-            subprocess.run(["rm", self.path])
+            os.remove(self.path)
         else:
             print(f"Was about to delete {self.path} , aborted it")
         
     def rename(self,newname):
         filename = self.path.split('/')[-1]
         newpath = '/'.join(self.path.split('/')[0:-1] + [newname])
-        subprocess.run(["mv",self.path, newpath])
+        os.replace(self.path, newpath)
         self.path = newpath
 
@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import h5py
+
+
+class H5FilePool:
+    """
+    Bounded LRU pool of open read-only h5py.File handles.
+
+    Reading the schema entries of an event (strain, t0, dt for every
+    detector, the approximants and PSDs of a posterior file ...) goes through
+    open(), so each file is opened once and reused, instead of once per entry.
+
+    Handles are owned by the pool: callers must not close them. A file that
+    is about to be rewritten has to be invalidated first, and a file that
+    changed on disk (size or mtime) is reopened automatically.
+
+    Callers hold handles through borrow(), which pins them while in use: a
+    pinned handle is never closed by eviction or invalidate(), it is closed
+    when its last user returns it instead (the pool can briefly hold more
+    than max_open files meanwhile).
+    """
+    def __init__(self, max_open=16):
+        self.max_open = max_open
+        self._files = OrderedDict()
+        self._pins = {}
+        self._retired = {}
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def key(path):
+        return os.path.abspath(path)
+
+    def _check_process(self):
+        # HDF5 handles don't survive a fork, so a child process starts
+        # with an empty pool rather than using its parent's handles
+        if os.getpid() != self._pid:
+            self._files = OrderedDict()
+            self._pins = {}
+            self._retired = {}
+            self._lock = threading.RLock()
+            self._pid = os.getpid()
+
+    def open(self, path):
+        """
+        Returns the pooled handle of a file without pinning it, so it may
+        be closed by later calls; use borrow() to hold on to it
+        """
+        return self._open(path, pin=False)
+
+    @contextmanager
+    def borrow(self, path):
+        """
+        Context manager lending the pooled handle of a file, pinned open
+        until the block ends
+        """
+        f = self._open(path, pin=True)
+        try:
+            yield f
+        finally:
+            self._unpin(f)
+
+    def _open(self, path, pin):
+        self._check_process()
+        key = self.key(path)
+        stat = os.stat(key)
+        signature = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            if key in self._files:
+                f, old_signature = self._files[key]
+                if (old_signature == signature) and f.id.valid:
+                    self._files.move_to_end(key)
+                    if pin:
+                        self._pins[id(f)] = self._pins.get(id(f), 0) + 1
+                    return f
+                self._close(key)
+            f = h5py.File(key, 'r')
+            self._files[key] = (f, signature)
+            if pin:
+                self._pins[id(f)] = 1
+            self._evict()
+            return f
+
+    def _unpin(self, f):
+        with self._lock:
+            if id(f) not in self._pins:
+                return
+            self._pins[id(f)] -= 1
+            if self._pins[id(f)] == 0:
+                del self._pins[id(f)]
+                # Handles invalidated or evicted while pinned close now
+                if id(f) in self._retired:
+                    del self._retired[id(f)]
+                    if f.id.valid:
+                        f.close()
+            self._evict()
+
+    def _evict(self):
+        # Closes the least recently used unpinned handles beyond max_open
+        unpinned = [key for key, (f, _) in self._files.items() if id(f) not in self._pins]
+        for key in unpinned[:max(len(self._files) - self.max_open, 0)]:
+            self._close(key)
+
+    def _close(self, key):
+        f, _ = self._files.pop(key)
+        if id(f) in self._pins:
+            self._retired[id(f)] = f
+        elif f.id.valid:
+            f.close()
+
+    def invalidate(self, path):
+        """
+        Closes the handle of a file that is about to be rewritten or deleted
+        """
+        self._check_process()
+        with self._lock:
+            if self.key(path) in self._files:
+                self._close(self.key(path))
+
+    def flush(self):
+        """
+        Closes handles to files that no longer exist or have changed on disk
+        """
+        self._check_process()
+        with self._lock:
+            for key in list(self._files):
+                f, signature = self._files[key]
+                if (not os.path.exists(key)) or ((os.stat(key).st_size, os.stat(key).st_mtime) != signature):
+                    self._close(key)
+
+    def close(self, folder=None):
+        """
+        Closes every handle, or only those of the files inside folder (the
+        pool is shared by every database of the process)
+        """
+        self._check_process()
+        prefix = None if folder is None else os.path.join(self.key(folder), '')
+        with self._lock:
+            for key in list(self._files):
+                if (prefix is None) or key.startswith(prefix):
+                    self._close(key)
+
+    def __contains__(self, path):
+        return self.key(path) in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+
+default_pool = H5FilePool()
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class Manifest:
+    """
+    Persistent record of the products downloaded into a data folder, kept
+    as an SQLite file inside the folder.
+
+    Each (event, product) pair has one row holding the file it lives in,
+    the detectors and duration it covers, its size and mtime, and for
+    posterior files the chosen and available approximants. Rows are keyed
+    by the exact event name, so GW190521 and GW190521_074359 never collide.
+    """
+    columns = ['event', 'product', 'path', 'detectors', 'duration', 'size', 'mtime',
+               'approximant', 'approximants', 'added']
+
+    def __init__(self, folder, filename=".manifest.sqlite"):
+        self.folder = folder
+        self.path = f"{folder.rstrip('/')}/{filename}"
+        self.is_new = not os.path.exists(self.path)
+        self._pid = None
+        with self.transaction() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS products (
+                                event TEXT NOT NULL,
+                                product TEXT NOT NULL,
+                                path TEXT NOT NULL,
+                                detectors TEXT,
+                                duration REAL,
+                                size INTEGER,
+                                mtime REAL,
+                                approximant TEXT,
+                                approximants TEXT,
+                                added REAL,
+                                PRIMARY KEY (event, product))""")
+
+    def connect(self):
+        # One connection per process, shared by its threads (the prefetch
+        # threads) under a lock. A forked child opens its own, as SQLite
+        # connections can't be carried across a fork.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+        return self._conn
+
+    def __getstate__(self):
+        # The connection stays behind, the copy opens its own
+        state = self.__dict__.copy()
+        for key in ['_conn', '_lock']:
+            state.pop(key, None)
+        state['_pid'] = None
+        return state
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        with self._lock, conn:
+            yield conn
+
+    def add(self, event, product, path, detectors=None, duration=None, approximant=None, approximants=None):
+        """
+        Records (or replaces) the file holding a product of an event. This is
+        a single transaction, so readers see either the old row or the new one.
+        """
+        stat = os.stat(path)
+        row = (event, product, path, json.dumps(detectors), duration, stat.st_size, stat.st_mtime,
+               approximant, json.dumps(approximants), time.time())
+        with self.transaction() as conn:
+            conn.execute(f"INSERT OR REPLACE INTO products VALUES ({','.join('?'*len(row))})", row)
+
+    def remove(self, event, product):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM products WHERE event = ? AND product = ?", (event, product))
+
+    def get(self, event, product):
+        with self.transaction() as conn:
+            row = conn.execute("SELECT * FROM products WHERE event = ? AND product = ?", (event, product)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(self.columns, row))
+        entry['detectors'] = json.loads(entry['detectors'])
+        entry['approximants'] = json.loads(entry['approximants'])
+        return entry
+
+    def contains(self, event, product, duration=None):
+        """
+        True if the product is recorded and its file is still on disk,
+        unchanged since it was recorded. If duration is given, the product
+        must also cover that duration (when its duration was recorded).
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT path, duration, size, mtime FROM products WHERE event = ? AND product = ?",
+                               (event, product)).fetchone()
+        if row is None:
+            return False
+        path, recorded_duration, size, mtime = row
+        if (duration is not None) and (recorded_duration is not None) and (float(duration) != recorded_duration):
+            return False
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_size == size) and (stat.st_mtime == mtime)
+
+    def events(self, product):
+        with self.transaction() as conn:
+            rows = conn.execute("SELECT event FROM products WHERE product = ? ORDER BY event", (product,)).fetchall()
+        return [row[0] for row in rows]
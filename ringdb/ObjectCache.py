@@ -0,0 +1,142 @@
+__all__ = ['ObjectCache']
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def mapped(array):
+    # Whether the array is (a view of) a numpy.memmap, whose pages live in
+    # the operating system's page cache rather than in this process
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+def columns(value):
+    # The columns of a DataFrame, or the Series itself
+    if isinstance(value, pd.Series):
+        return [value]
+    return [value.iloc[:, i] for i in range(value.shape[1])]
+
+def nbytes(value):
+    """
+    Memory held by a cached product: the size of the arrays underneath
+    DataFrames, Series (including their index) and numpy arrays, summed
+    over dictionaries such as the per-detector strain and PSDs. Memory
+    mapped arrays (strain(mmap=True)) take no memory of their own and
+    aren't counted.
+    """
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.index.memory_usage(deep=True)) + \
+            sum(int(column.memory_usage(index=False, deep=True)) for column in columns(value) if not mapped(column.values))
+    if isinstance(value, np.ndarray):
+        return 0 if mapped(value) else value.nbytes
+    return 0
+
+def read_only(array):
+    # Marks the array and every array it is a view of as read-only, so
+    # later views of the same memory are read-only too
+    while isinstance(array, np.ndarray):
+        array.flags.writeable = False
+        array = array.base
+
+def freeze(value):
+    # Cached arrays are shared between every caller, so they are made
+    # read-only: writing into them raises instead of corrupting the cache
+    if isinstance(value, dict):
+        for v in value.values():
+            freeze(v)
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        for column in columns(value):
+            read_only(column.values)
+    elif isinstance(value, np.ndarray):
+        read_only(value)
+    return value
+
+def share(value):
+    # A new container over the same read-only arrays, so callers can add
+    # or drop columns without touching the cached object
+    if isinstance(value, dict):
+        return {k: share(v) for k, v in value.items()}
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, pd.Series):
+        shared = value.copy(deep=False)
+        shared.name = value.name
+        return shared
+    return value
+
+
+class ObjectCache:
+    """
+    Bounded LRU cache of loaded products (posteriors, PSDs, strain), keyed
+    by (event, product, arguments) and limited by the bytes of the arrays
+    it holds rather than by the number of entries.
+
+    Products are returned as shallow copies over read-only arrays: use
+    .copy() on a result before modifying its values in place.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(event, product, kwargs):
+        hashable = lambda v: tuple(hashable(x) for x in v) if isinstance(v, (list, tuple)) else v
+        return (event, product, tuple(sorted((k, hashable(v)) for k, v in kwargs.items())))
+
+    def get(self, event, product, kwargs, load):
+        """
+        Returns the cached product, or loads it with load() and caches it
+        """
+        key = self.key(event, product, kwargs)
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return share(self._items[key][0])
+            self.misses += 1
+
+        # Loading happens outside the lock, so other products can be served
+        # (measured first, pandas can't measure read-only object columns)
+        value = load()
+        size = nbytes(value)
+        freeze(value)
+        with self._lock:
+            if (size <= self.max_bytes) and (key not in self._items):
+                self._items[key] = (value, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    self._evict(next(iter(self._items)))
+        return share(value)
+
+    def _evict(self, key):
+        _, size = self._items.pop(key)
+        self.bytes -= size
+        self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items = OrderedDict()
+            self.bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'items': len(self._items), 'bytes': self.bytes, 'max_bytes': self.max_bytes}
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,136 @@
+from ringdown import PowerSpectrum
+import pandas as pd
+import numpy as np
+
+
+class PSD(PowerSpectrum):
+    def __init__(self, *args, **kwargs):
+        super(PSD, self).__init__(*args, **kwargs)
+
+    @property
+    def _constructor(self):
+        return PSD
+
+    def plot(self):
+        """
+        Do a loglog plot of the powerspectrum
+        """
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+        ax.loglog(self)
+        plt.show()
+
+    @property
+    def bin_sizes(self):
+        """
+        Plot the bin sizes of each frequency bin, to detect if there
+        are any inconsistencies in the bin sizes
+        """
+        return pd.Series(self.freq[1:-1] - self.freq[0:-2], index=self.freq[0:-2])
+
+    def _on_grid(self, freq, values):
+        # A PSD over the frequencies freq holding values, keeping this
+        # PSD's name and detector, without copying values
+        return PSD(values, index=freq, name=self.name, ifo=self.ifo, attrs=self.attrs, copy=False)
+
+    def low_pad(self, from_freq=None, to_freq=0.0, val=None, copy=True):
+        """
+        Pads the power spectrum from from_freq down to to_freq
+        with the value val or, by default, the power at from_freq
+
+        New bins continue the uniform frequency grid below its lowest bin,
+        down to the lowest bin at or above to_freq. With copy=False, a
+        PSD that needs no new bins gets the padding written into its own
+        values and is returned itself.
+        """
+        # Set parameter values
+        df = self.delta_f
+        freq = np.asarray(self.index, dtype=float)
+        from_freq = from_freq or freq[0]
+
+        # Set fill value and number of new freq bins
+        fill_value = val or self[from_freq]
+        n_new = max(int(np.floor((freq[0] - to_freq)/df + 1e-6)), 0)
+        n_fill = n_new + np.searchsorted(freq, from_freq)
+
+        if (n_new == 0) and not copy:
+            self.iloc[:n_fill] = fill_value
+            return self
+        values = np.empty(n_new + len(freq))
+        values[n_new:] = self.values
+        values[:n_fill] = fill_value
+        return self._on_grid(np.concatenate([freq[0] - df*np.arange(n_new, 0, -1), freq]), values)
+
+    def high_pad(self, from_freq=None, to_freq=None, val=None, inclusive=True, copy=True):
+        """
+        Pads the power spectrum in such way that all frequency bins 
+        above from_freq get assigned the power at from_freq (or val).
+        
+        The default behaviour is to extend the frequency indices all the 
+        way up to the next power of two. New bins continue the uniform
+        frequency grid above its highest bin; if to_freq falls between two
+        bins, inclusive says whether the grid ends on the bin above it
+        or the one below it. With copy=False, a PSD that needs no new bins
+        gets the padding written into its own values and is returned itself.
+        """
+        # Set parameter values
+        df = self.delta_f
+        freq = np.asarray(self.index, dtype=float)
+        from_freq = from_freq or freq[-1]
+
+        # Set fill value and number of new freq bins
+        fill_value = val or self[from_freq]
+        new_highest_freq_bin = next_power_of_two(freq[-1]) if to_freq is None else to_freq
+        bins = (new_highest_freq_bin - freq[-1])/df
+        n_new = max(int(np.ceil(bins - 1e-6) if inclusive else np.floor(bins + 1e-6)), 0)
+        first_fill = np.searchsorted(freq, from_freq)
+
+        if (n_new == 0) and not copy:
+            self.iloc[first_fill:] = fill_value
+            return self
+        values = np.empty(len(freq) + n_new)
+        values[:len(freq)] = self.values
+        values[first_fill:] = fill_value
+        return self._on_grid(np.concatenate([freq, freq[-1] + df*np.arange(1, n_new + 1)]), values)
+
+
+def next_power_of_two(f):
+    return int(2**np.ceil(np.log(f)/np.log(2)))
+
+def pad_psds(psds, to_low=0.0, to_high=None):
+    """
+    Pads a dictionary of PSDs (e.g. labelled by detector) onto one common
+    uniform frequency grid in a single pass, from to_low up to to_high
+    (by default the next power of two above the highest frequency of any
+    of them). Each PSD is extended below its lowest bin with its lowest
+    power and above its highest bin with its highest power.
+
+    The PSDs must share their frequency spacing and lie on the same grid,
+    otherwise a ValueError is raised. The padded PSDs share one frequency
+    index.
+    """
+    psds = dict(psds)
+    df = next(iter(psds.values())).delta_f
+    lowest = min(psd.index[0] for psd in psds.values())
+    highest = max(psd.index[-1] for psd in psds.values())
+    to_high = next_power_of_two(highest) if to_high is None else max(to_high, highest)
+
+    # The common grid, anchored on the lowest bin of any of the PSDs
+    start = lowest - df*max(int(np.floor((lowest - to_low)/df + 1e-6)), 0)
+    n = int(np.ceil((to_high - start)/df - 1e-6)) + 1
+    freq = pd.Index(start + df*np.arange(n))
+
+    padded = {}
+    for key, psd in psds.items():
+        offset = (psd.index[0] - start)/df
+        if (not np.isclose(psd.delta_f, df, rtol=1e-9, atol=0)) or (abs(offset - round(offset)) > 1e-6):
+            raise ValueError(f"PSD {key} is not on the same frequency grid as the others "
+                             f"(delta_f {psd.delta_f} vs {df}, first bin {psd.index[0]})")
+        first = int(round(offset))
+        last = first + len(psd)
+        values = np.empty(n)
+        values[:first] = psd.values[0]
+        values[first:last] = psd.values
+        values[last:] = psd.values[-1]
+        padded[key] = psd._on_grid(freq, values)
+    return padded
@@ -1,13 +1,19 @@
 import os
+import json
+import hashlib
+import threading
 import subprocess
 from . import DataFrameClasses as ringdown
-from ringdown import PowerSpectrum
-from tqdm import tqdm
 from .peak import complex_strain_peak_time_td
 from . import File
+from .Catalog import URLCatalog
+from .Manifest import Manifest
+from .WorkQueue import WorkQueue
+from .H5Pool import default_pool
+from .Precision import DtypePolicy
+from .Schema import preprocess_path, plan_schema_reads, execute_schema_reads, select_detector
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
 approximant_order = ["IMRPhenomPv2",
 "IMRPhenomPv3",
@@ -24,18 +30,24 @@ default_schema = {'samples' : {'type': 'array', 'path': '{approximant}/posterior
 		  'psd': {'type': 'array', 'path': '{approximant}/psds/{detector}'}}
 
 
-import lalsimulation as ls
 import h5py
 
+_extraction_lock = threading.Lock()
+
 class PosteriorDatabase:
-    def __init__(self, folder, url_df, psd_url_df, strain_url_df, schema=default_schema, approximant_order=approximant_order, cosmo=True):
+    def __init__(self, folder, url_df, psd_url_df, strain_url_df, schema=default_schema, approximant_order=approximant_order, cosmo=True, catalog=None, pool=None, dtypes=None, column_cache=False):
         self.url_df = url_df
+        self.catalog = catalog or URLCatalog(url_df, strain_url_df, psd_url_df)
         self._folder = folder
         self.schema = schema
         self.approximant_order = approximant_order
         self.cosmo = cosmo
         self.psd_url_df = psd_url_df
         self.strain_url_df = strain_url_df
+        self._manifest = None
+        self.pool = pool if pool is not None else default_pool
+        self.dtypes = dtypes if dtypes is not None else DtypePolicy()
+        self.column_cache = column_cache
 
     @property
     def folder(self):
@@ -48,7 +60,7 @@ class PosteriorDatabase:
         self._folder = folder
         
     def available_detectors(self, event):
-        return list(self.strain_url_df[self.strain_url_df.Event == event].Detector.unique())
+        return list(self.catalog.detectors.get(event, []))
     
     def event_path(self, event):
         file_type = self.get_file_extension(event)
@@ -56,50 +68,85 @@ class PosteriorDatabase:
         return post_filename
 
     def in_catalog(self, event, catalog):
-        is_in_the_catalog = self.url_df[self.url_df.event == event].catalog.values[0] == catalog
-        return is_in_the_catalog
+        return self.catalog.catalog[event] == catalog
     
     def in_GWTC1(self, event):
-        url = self.url_df[self.url_df.event == event].url.values[0]
-        events = self.url_df[self.url_df.url == url].event.unique()
-        return ('GW150914' in events)
+        url = self.catalog.posterior_first[event]
+        return ('GW150914' in self.catalog.url_events[url])
     
     def in_GWTC3(self, event):
-        is_in_the_catalog = self.url_df[self.url_df.event == event].catalog.values[0] == 'GWTC-3'
-        return is_in_the_catalog
+        return self.in_catalog(event, 'GWTC-3')
     
+    @property
+    def manifest(self):
+        if (self._manifest is None) or (self._manifest.folder != self.folder):
+            self._manifest = Manifest(self.folder)
+            if self._manifest.is_new:
+                self.register_existing_files()
+        return self._manifest
+
+    def register_file(self, event, path, product='posteriors'):
+        # Record a downloaded file in the manifest, along with the
+        # approximants inside it so they don't need to be looked up again
+        self.pool.invalidate(path)
+        approximants = None
+        approximant = None
+        if (product == 'posteriors') and (path.split('.')[-1] in ['h5', 'hdf5']):
+            approximants = self.read_approximants(path)
+            approximant = self.pick_approximant(approximants)
+        self.manifest.add(event, product, path, detectors=self.available_detectors(event),
+                          approximant=approximant, approximants=approximants)
+        # New posterior samples need their peak times calculating again
+        if (product == 'posteriors') and os.path.exists(f"{self.folder}/PeakTimes/.queue.sqlite"):
+            WorkQueue(f"{self.folder}/PeakTimes").reset([event])
+
+    def register_existing_files(self):
+        # Data folders filled before the manifest existed
+        for file in os.listdir(self.folder):
+            event, _, file_type = file.partition('.')
+            if file_type in ['h5', 'hdf5', 'dat'] and (event in self.catalog.catalog):
+                self.register_file(event, f"{self.folder}/{file}")
+            elif (event[-4:] == '_psd') and (event[:-4] in self.catalog.psd_url):
+                self.register_file(event[:-4], f"{self.folder}/{file}", product='psd')
+
     def event_exists(self, event):
-        return os.path.exists(self.event_path(event))
+        if self.manifest.contains(event, 'posteriors'):
+            return True
+        # Pick up files that were placed in the folder by hand
+        if os.path.exists(self.event_path(event)):
+            self.register_file(event, self.event_path(event))
+            return True
+        return False
+
+    def read_approximants(self, path):
+        with self.pool.borrow(path) as f:
+            approximants = list(f.keys())
+        return [a for a in approximants if a not in ['combined','history', 'version']]
     
     def available_approximants(self, event):
         if self.event_exists(event):
-            with h5py.File(self.event_path(event),'r') as f:
-                approximants = list(f.keys())
+            return self.manifest.get(event, 'posteriors')['approximants']
         else:
             print("Hasn't been downloaded")
-        approximants2 = [a for a in approximants if a not in ['combined','history', 'version']]
-        return approximants2
     
-    def choose_approximant(self, event):
+    def pick_approximant(self, list_of_approximants):
         # Chooses the right available waveform approximant based on the priority list provided
         # in self.approximant_order
-        list_of_approximants = self.available_approximants(event)
         for test_approx in self.approximant_order:
             options = [approx for approx in list_of_approximants if (test_approx in approx)]
             if len(options) != 0:
                 return min(options)
         return None
+
+    def choose_approximant(self, event):
+        return self.pick_approximant(self.available_approximants(event))
         
     @property
     def events_present(self):
-        files = os.listdir(self.folder)
-        files = [f.split('.')[0] for f in files if f[0] != "."] # Keep only those that aren't hidden
-        return files
+        return self.manifest.events('posteriors')
     
     def get_url(self, event):
-        mask = (self.url_df.event == event) & (self.url_df.cosmo.isnull() | (self.url_df.cosmo==self.cosmo))
-        url = self.url_df.loc[mask,'url'].values[0]
-        return url
+        return self.catalog.posterior_url[(event, bool(self.cosmo))]
 
     def get_file_extension(self, event):
         # This function returns the expected file extension of the finally saved file
@@ -140,71 +187,186 @@ class PosteriorDatabase:
         return z, dtype
 
     
-    def download_file(self, event):
+    @property
+    def extraction_record_path(self):
+        return f"{self.folder}/.extracted.json"
+
+    def extracted_members(self, archive):
+        """
+        Returns the members of the archive that have already been extracted
+        """
+        if not os.path.exists(self.extraction_record_path):
+            return []
+        with open(self.extraction_record_path) as f:
+            return json.load(f).get(archive, [])
+
+    def record_extraction(self, archive, members):
+        with _extraction_lock:
+            record = {}
+            if os.path.exists(self.extraction_record_path):
+                with open(self.extraction_record_path) as f:
+                    record = json.load(f)
+            record[archive] = sorted(set(record.get(archive, [])) | set(members))
+            with open(self.extraction_record_path + ".part", "w") as f:
+                json.dump(record, f, indent=1)
+            os.replace(self.extraction_record_path + ".part", self.extraction_record_path)
+
+    @staticmethod
+    def member_event(member, events):
+        # Match the longest event name, so that GW190521 doesn't claim
+        # the files of GW190521_074359
+        basename = member.split('/')[-1]
+        matches = [e for e in events if e in basename]
+        return max(matches, key=len) if matches else None
+
+    def download_file(self, event, events=None):
+        """
+        Downloads the posterior file of the event.
+
+        If the posteriors come inside a tar or zip archive, only the files
+        belonging to the event (and to any other events of the same archive
+        listed in events) are streamed out of it. The archive is kept until
+        all of its events have been recorded as extracted, so it is only
+        ever downloaded once and no member is unpacked twice. The event's
+        posterior file is the member named after the event (or else the one
+        with the shortest name), and is saved as {event}.{extension}; any
+        other file of the event keeps its own name, so none of them
+        overwrite each other.
+        """
         # Get the url to download for this event
         url = self.get_url(event)
-        mask = (self.url_df.event == event) & (self.url_df.cosmo.isnull() | (self.url_df.cosmo==self.cosmo))
-        file_type = self.url_df.loc[mask,'filename'].values[0].split('.')[-1]
+        archive_name = self.catalog.filename[url]
+        file_type = archive_name.split('.')[-1]
         
         # Check to see if this file is a single event's file or does this compressed file hold multiple events?
-        events = self.url_df[self.url_df.url == url].event.unique()
+        archive_events = self.catalog.url_events[url]
         
-        if 'GW150914' in events:
+        if file_type not in ['tar', 'zip']:
+            thefile = File.from_url(url, self.folder, new_filename=f"{event}.{file_type}")
+            self.register_file(event, thefile.path)
+            return thefile
+
+        if 'GW150914' in archive_events:
             print("Samples from GWTC-1 come in one file, and there isn't a straightforward")
             print("a way to download only one particular event from GWTC-1.") 
-            print("So we have to download them together")
-        
-        # Download the file
-        thefile = File.from_url(url, self.folder, new_filename=f"{event}.{file_type}")
-        
-        multiple_events = (len(events) > 1)
-        
-        # Extract and place in the correct location if needed
-        if file_type == 'tar':
-            # Extract and delete the compressed file
-            thefile.extract_here()
-            thefile.delete()
-            
-            # Get the eventual file extension
-            file_type = self.get_file_extension(event)
+            print("So we only keep the events asked for and extract others when they are needed")
 
-            # Empty out the hdf5 from the extracted folder then delete the folder
-            filepath = f"{self.folder}/{event}/{event}.{file_type}"
-            new_path = f"{self.folder}/{event}.{file_type}"
-            subprocess.run(['mv',filepath, new_path])
-            subprocess.run(['rm','-rf',f"{self.folder}/{event}"])
-            
-        elif file_type == 'zip':
-            # Extract and delete the compressed file
-            thefile.extract_here()
+        # Download the archive, unless an earlier call left it here
+        thefile = File(f"{self.folder}/{archive_name}")
+        if not thefile.exists:
+            thefile = File.from_url(url, self.folder, new_filename=archive_name)
+
+        # Work out where each member of the archive belongs
+        wanted = set([event] + [e for e in (events or []) if e in archive_events])
+        by_event = {}
+        for member in thefile.members:
+            member_event = self.member_event(member, archive_events)
+            if member_event is not None:
+                by_event.setdefault(member_event, []).append(member)
+        done = self.extracted_members(archive_name)
+        basename = lambda member: member.split('/')[-1]
+        destinations, posterior_files = {}, {}
+        for member_event, members in by_event.items():
+            if member_event not in wanted:
+                continue
+            main = min(members, key=lambda m: (basename(m).rsplit('.', 1)[0] != member_event, len(basename(m)), m))
+            for member in members:
+                if member == main:
+                    dest = f"{self.folder}/{member_event}.{member.split('.')[-1]}"
+                    posterior_files[member_event] = dest
+                else:
+                    dest = f"{self.folder}/{basename(member)}"
+                if (member in done) and os.path.exists(dest):
+                    continue
+                destinations[member] = dest
+
+        thefile.extract_members(destinations)
+        self.record_extraction(archive_name, destinations.keys())
+        for member_event, dest in posterior_files.items():
+            self.register_file(member_event, dest)
+
+        # Once every event is out of the archive there is no need to keep it
+        extracted = set(done) | set(destinations)
+        if all(member in extracted for members in by_event.values() for member in members):
             thefile.delete()
-            
-            # GWTC-1 comes in a zip file which always opens up as a folder called pesummary_samples
-            # This line is to rename it to a folder with the name of the current event
-            if "pesummary_samples" in os.listdir(self.folder):
-                subprocess.run(['mv',f"{self.folder}/pesummary_samples",f"{self.folder}/{event}"])
-                
-            # Empty out the hdf5 from the extracted folder then delete the folder
-            downloaded_folder = f"{self.folder}/{event}"
-            for file in os.listdir(downloaded_folder):
-                file_type = file.split(".")[-1]
-                file_eventname = [e for e in events if e in file][0]
-                subprocess.run(['mv',f"{downloaded_folder}/{file}", f"{self.folder}/{file_eventname}.{file_type}"])
-            subprocess.run(['rm','-rf',f"{self.folder}/{event}"])
-            
-        # Find the corresponding file in the folder as a sanity check:
-        filename = [file for file in os.listdir(self.folder) if event in file][0]
-        
-        # Return a file with the same 
-        return File(f"{self.folder}/{filename}")
+
+        return File(posterior_files.get(event, self.event_path(event)))
     
-    def posteriors(self,eventname, peaks=False, f_ref=20.0, f_low=20.0):
-        # Download the file if it doesn't exist
-        if not self.event_exists(eventname):
-            self.download_file(eventname)
-            
-        replace_names = lambda x: x.replace('C01:','').replace(':HighSpin','').replace('-HS','')
-            
+    @staticmethod
+    def resolve_columns(available, columns):
+        """
+        Works out which stored field each requested column is read from.
+        A column that isn't stored falls back to its _non_evolved version.
+        """
+        sources, missing = {}, []
+        for column in columns:
+            if column in ['waveform_name', 'waveform_code']:
+                continue
+            if column in available:
+                sources[column] = column
+            elif f"{column}_non_evolved" in available:
+                sources[column] = f"{column}_non_evolved"
+            else:
+                missing.append(column)
+        if len(missing) != 0:
+            raise KeyError(f"Columns {missing} are not in the posterior samples")
+        return sources
+
+    def read_fields(self, dataset, fields, dtypes=None, start=None, stop=None):
+        """
+        Reads the given fields of a compound posterior dataset, already in
+        the dtypes of the dtype policy (HDF5 converts them as it reads).
+        start and stop select a slice of the samples.
+        """
+        dtypes = dtypes if dtypes is not None else self.dtypes
+        target = np.dtype([(field, dtypes.posterior_dtype(field, dataset.dtype[field])) for field in fields])
+        start, stop, _ = slice(start, stop).indices(dataset.shape[0])
+        samples = np.empty(max(stop - start, 0), dtype=target)
+        if (len(fields) != 0) and (len(samples) != 0):
+            dataset.read_direct(samples, source_sel=np.s_[start:stop])
+        return samples
+
+    @staticmethod
+    def waveform(approximant):
+        # Name and lalsimulation code of the waveform used for the samples,
+        # the GWTC-1 .dat files (no approximant) all used IMRPhenomPv2
+        import lalsimulation as ls
+        if approximant is None:
+            name = 'IMRPhenomPv2'
+        else:
+            name = approximant.replace('C01:','').replace(':HighSpin','').replace('-HS','')
+        return name, int(getattr(ls, name))
+
+    def finish_table(self, df_posteriors_all, info, columns=None, dtypes=None):
+        dtypes = dtypes if dtypes is not None else self.dtypes
+        waveform_columns = dtypes.waveform_columns(len(df_posteriors_all), info['waveform_name'], info['waveform_code'])
+        for column, value in waveform_columns.items():
+            df_posteriors_all[column] = value
+
+        # Edit the posteriors so all of them have atleast two columns called
+        # 'final_spin' and 'final_mass'. The following just says that if
+        # there are non_evolved quantities with no standard counterparts, just
+        # create a new column with 'non_evolved' removed
+        # (when columns are given, resolve_columns already did this)
+        if columns is None:
+            for x in df_posteriors_all.columns:
+                if '_non_evolved' in x:
+                    new_col = x.replace('_non_evolved','')
+                    if new_col not in df_posteriors_all.columns:
+                        df_posteriors_all[new_col] = df_posteriors_all[x]
+        return df_posteriors_all
+
+    def read_source(self, eventname, columns=None, dtypes=None):
+        """
+        Reads the normalised posterior table of the event from its posterior
+        file, in the dtypes of the given dtype policy.
+
+        Returns the table and a dictionary with the f_ref, f_low and the
+        waveform name and code of the samples.
+        """
+        dtypes = dtypes if dtypes is not None else self.dtypes
+        info = {'f_ref': None, 'f_low': None}
+
         # Create a dataframe of posteriors from the hdf5 or h5 file, or 
         # do the same from the .dat files
         # This adds in the waveform used to generate the posteriors and it's
@@ -212,105 +374,498 @@ class PosteriorDatabase:
         post_filename = self.event_path(eventname)
         file_type = post_filename.split('.')[-1]
         if (file_type == 'h5') or (file_type == 'hdf5'):
-            with h5py.File(post_filename,'r') as f:
-                approx = self.choose_approximant(eventname)
-                posterior_path = f"/{approx}/posterior_samples"
-                all_posteriors = f[posterior_path][:]
-                df_posteriors_all = pd.DataFrame(all_posteriors)
-                waveform_name = replace_names(approx)
-                waveform_code = getattr(ls,waveform_name)
-                df_posteriors_all['waveform_name'] = waveform_name
-                df_posteriors_all['waveform_code'] = int(waveform_code)
+            # (choosing the approximant may register the file, which
+            # reopens it in the pool, so it comes first)
+            approx = self.choose_approximant(eventname)
+            posterior_path = f"/{approx}/posterior_samples"
+            with self.pool.borrow(post_filename) as f:
+                # Only read the needed fields of the compound dataset
+                dataset = f[posterior_path]
+                if columns is None:
+                    sources = {name: name for name in dataset.dtype.names}
+                else:
+                    sources = self.resolve_columns(dataset.dtype.names, columns)
+                some_posteriors = self.read_fields(dataset, list(dict.fromkeys(sources.values())), dtypes=dtypes)
                 if f"/{approx}/meta_data/meta_data" in f:
-                    f_ref = f[f"/{approx}/meta_data/meta_data/f_ref"][()]
-                    f_low = f[f"/{approx}/meta_data/meta_data/f_low"][()]
+                    info['f_ref'] = f[f"/{approx}/meta_data/meta_data/f_ref"][()]
+                    info['f_low'] = f[f"/{approx}/meta_data/meta_data/f_low"][()]
+            df_posteriors_all = pd.DataFrame({column: some_posteriors[source] for column, source in sources.items()})
+            info['waveform_name'], info['waveform_code'] = self.waveform(approx)
         elif (file_type == 'dat'):
-            df_posteriors_all = pd.read_csv(post_filename,delimiter='\t')
-            df_posteriors_all['waveform_name'] = 'IMRPhenomPv2'
-            df_posteriors_all['waveform_code'] = int(ls.IMRPhenomPv2)
+            # The parser converts straight to the dtypes of the dtype policy
+            available = pd.read_csv(post_filename,delimiter='\t',nrows=0).columns
+            usecols = list(available) if columns is None else list(set(self.resolve_columns(available, columns).values()))
+            dtype = None if dtypes.posteriors is None else {c: dtypes.posterior_dtype(c, np.float64) for c in usecols}
+            some_posteriors = pd.read_csv(post_filename,delimiter='\t',usecols=usecols,dtype=dtype)
+            if columns is None:
+                df_posteriors_all = some_posteriors
+            else:
+                sources = self.resolve_columns(available, columns)
+                df_posteriors_all = pd.DataFrame({column: some_posteriors[source].values for column, source in sources.items()})
+            info['waveform_name'], info['waveform_code'] = self.waveform(None)
 
-        # Edit the posteriors so all of them have atleast two columns called
-        # 'final_spin' and 'final_mass'. The following just says that if
-        # there are non_evolved quantities with no standard counterparts, just
-        # create a new column with 'non_evolved' removed
-        for x in df_posteriors_all.columns:
-            if '_non_evolved' in x:
-                new_col = x.replace('_non_evolved','')
-                if new_col not in df_posteriors_all.columns:
-                    df_posteriors_all[new_col] = df_posteriors_all[x]
+        return self.finish_table(df_posteriors_all, info, columns=columns, dtypes=dtypes), info
 
+    def iter_posteriors(self, eventname, chunk_size=100000, columns=None, structured=False):
+        """
+        Yields the posterior samples of the event in chunks of chunk_size
+        samples, reading only one chunk at a time from disk (HDF5
+        hyperslabs, or a chunked parse of .dat files), so per-sample
+        pipelines run in bounded memory.
 
-        if peaks:
-            peak_df = self.calculate_t_peaks(eventname, f_ref=f_ref, f_low=f_low)
-            new_df = pd.concat([peak_df, df_posteriors_all],axis=1)
-            masses_match = np.all(np.isclose(new_df['final_mass'], new_df['final_mass_check']))
-            spins_match = np.all(np.isclose(new_df['final_spin'], new_df['final_spin_check']))
-            if masses_match and spins_match:
-                return new_df
+        Chunks are DataFrames like those of posteriors(), indexed by the
+        sample number within the whole posterior. With structured=True the
+        chunks are numpy structured arrays of the requested columns instead,
+        without the waveform columns.
+        """
+        if not self.event_exists(eventname):
+            self.download_file(eventname)
+
+        post_filename = self.event_path(eventname)
+        file_type = post_filename.split('.')[-1]
+        if (file_type == 'h5') or (file_type == 'hdf5'):
+            approx = self.choose_approximant(eventname)
+            # The handle stays pinned in the pool for the iterator's lifetime,
+            # so files opened between chunks can't evict it
+            with self.pool.borrow(post_filename) as f:
+                dataset = f[f"/{approx}/posterior_samples"]
+                if columns is None:
+                    sources = {name: name for name in dataset.dtype.names}
+                else:
+                    sources = self.resolve_columns(dataset.dtype.names, columns)
+                fields = list(dict.fromkeys(sources.values()))
+                info = dict(zip(['waveform_name', 'waveform_code'], self.waveform(approx)))
+                for start in range(0, dataset.shape[0], chunk_size):
+                    samples = self.read_fields(dataset, fields, start=start, stop=start + chunk_size)
+                    if structured:
+                        yield self.rename_fields(samples, sources)
+                        continue
+                    chunk = pd.DataFrame({column: samples[source] for column, source in sources.items()},
+                                         index=pd.RangeIndex(start, start + len(samples)))
+                    yield self.finish_table(chunk, info, columns=columns)
+        elif (file_type == 'dat'):
+            available = pd.read_csv(post_filename,delimiter='\t',nrows=0).columns
+            sources = {name: name for name in available} if columns is None else self.resolve_columns(available, columns)
+            usecols = list(set(sources.values()))
+            dtype = None if self.dtypes.posteriors is None else {c: self.dtypes.posterior_dtype(c, np.float64) for c in usecols}
+            info = dict(zip(['waveform_name', 'waveform_code'], self.waveform(None)))
+            for some_posteriors in pd.read_csv(post_filename,delimiter='\t',usecols=usecols,dtype=dtype,chunksize=chunk_size):
+                chunk = pd.DataFrame({column: some_posteriors[source].values for column, source in sources.items()},
+                                     index=some_posteriors.index)
+                if structured:
+                    yield chunk.to_records(index=False)
+                    continue
+                yield self.finish_table(chunk, info, columns=columns)
+
+    @staticmethod
+    def rename_fields(samples, sources):
+        # Structured array with a field per requested column, named after the
+        # column rather than the stored field it was read from
+        if all(column == source for column, source in sources.items()):
+            return samples
+        renamed = np.empty(samples.shape, dtype=[(column, samples.dtype[source]) for column, source in sources.items()])
+        for column, source in sources.items():
+            renamed[column] = samples[source]
+        return renamed
+
+    def cache_path(self, event):
+        # Folder holding the columnar cache of the normalised posteriors,
+        # keyed by event, approximant and cosmo flag
+        approx = self.choose_approximant(event) if self.event_path(event).split('.')[-1] in ['h5', 'hdf5'] else None
+        key = f"{approx or 'samples'}-{'cosmo' if self.cosmo else 'nocosmo'}".replace(':', '_').replace('/', '_')
+        return f"{self.folder}/PosteriorCache/{event}/{key}"
+
+    def write_cache(self, eventname, loaded=None):
+        """
+        Writes the full posterior table of the event, at its stored
+        precision, to the columnar cache: one .npy file per column plus a
+        meta.json recording the column order, the waveform, f_ref/f_low,
+        the content hash of the table and the size and mtime of the
+        posterior file it was built from. Returns False if the table can't
+        be cached.
+
+        loaded is the (table, info) of read_source if the full table was
+        already read at its stored precision, otherwise it is read here.
+        """
+        path = self.cache_path(eventname)
+        source = self.event_path(eventname)
+        df, info = loaded if loaded is not None else self.read_source(eventname, dtypes=DtypePolicy())
+        columns = list(df.columns)
+        stored = [c for c in columns if c not in ['waveform_name', 'waveform_code']]
+        if any(df[c].dtype.kind not in 'biufc' for c in stored):
+            return False
+
+        os.makedirs(path, exist_ok=True)
+        # meta.json marks the cache as complete, so it goes first and comes back last
+        if os.path.exists(f"{path}/meta.json"):
+            os.remove(f"{path}/meta.json")
+        for column in stored:
+            filename = f"{path}/{columns.index(column)}.npy"
+            with open(f"{filename}.part", 'wb') as file:
+                np.save(file, np.ascontiguousarray(df[column].values))
+            os.replace(f"{filename}.part", filename)
+
+        stat = os.stat(source)
+        as_float = lambda x: None if x is None else float(np.squeeze(x))
+        meta = {'event': eventname, 'source': source, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                'columns': columns, 'n': len(df), 'waveform_name': info['waveform_name'],
+                'waveform_code': info['waveform_code'], 'f_ref': as_float(info['f_ref']),
+                'f_low': as_float(info['f_low']), 'hash': hash_table(df)}
+        with open(f"{path}/meta.json.part", 'w') as file:
+            json.dump(meta, file)
+        os.replace(f"{path}/meta.json.part", f"{path}/meta.json")
+        return True
+
+    def cache_meta(self, eventname):
+        # The meta data of the columnar cache, if it is still valid
+        path = self.cache_path(eventname)
+        if not os.path.exists(f"{path}/meta.json"):
+            return None
+        with open(f"{path}/meta.json") as file:
+            meta = json.load(file)
+        source = self.event_path(eventname)
+        if (not os.path.exists(source)) or ('hash' not in meta):
+            return None
+        stat = os.stat(source)
+        if (meta['source'] != source) or (meta['size'] != stat.st_size) or (meta['mtime'] != stat.st_mtime):
+            return None
+        return meta
+
+    def posterior_hash(self, eventname, posteriors=None):
+        """
+        Content hash of the posterior samples of the event (see hash_table)
+        and the number of samples. Hashed from posteriors if they are
+        already loaded, read from the columnar cache when there is one, and
+        otherwise hashed from the peak_columns of the posterior file.
+        """
+        if posteriors is not None:
+            return hash_table(posteriors), len(posteriors)
+        if self.column_cache:
+            meta = self.cache_meta(eventname)
+            if (meta is None) and self.write_cache(eventname):
+                meta = self.cache_meta(eventname)
+            if meta is not None:
+                return meta['hash'], meta['n']
+        df, _ = self.read_source(eventname, columns=self.peak_inputs(eventname))
+        return hash_table(df), len(df)
+
+    def stored_columns(self, eventname):
+        # Names of the fields stored in the posterior file of the event
+        post_filename = self.event_path(eventname)
+        if post_filename.split('.')[-1] in ['h5', 'hdf5']:
+            approx = self.choose_approximant(eventname)
+            with self.pool.borrow(post_filename) as f:
+                return list(f[f"/{approx}/posterior_samples"].dtype.names)
+        return list(pd.read_csv(post_filename, delimiter='\t', nrows=0).columns)
+
+    def peak_inputs(self, eventname):
+        # The peak_columns the posterior file of the event has
+        available = self.stored_columns(eventname)
+        return [c for c in peak_columns if (c in available) or (f"{c}_non_evolved" in available)]
+
+    def read_cache(self, eventname, columns=None):
+        """
+        Reads the normalised posteriors of the event from the columnar
+        cache, in the dtypes of the dtype policy. Returns the table and the
+        cache's meta data, or None if there is no cache or the posterior
+        file has changed since it was written.
+        """
+        meta = self.cache_meta(eventname)
+        if meta is None:
+            return None
+        path = self.cache_path(eventname)
+
+        waveform_columns = self.dtypes.waveform_columns(meta['n'], meta['waveform_name'], meta['waveform_code'])
+        if columns is None:
+            columns = meta['columns']
+        else:
+            # The waveform columns always come last, as in read_source
+            columns = [c for c in columns if c not in waveform_columns] + list(waveform_columns)
+        missing = [c for c in columns if c not in meta['columns']]
+        if len(missing) != 0:
+            raise KeyError(f"Columns {missing} are not in the posterior samples")
+
+        data = {}
+        for column in columns:
+            if column in waveform_columns:
+                data[column] = waveform_columns[column]
             else:
-                print(masses_match, spins_match)
-                print(new_df[['final_mass','final_mass_check']])
-                print(new_df[['final_spin','final_spin_check']])
-                raise ValueError("The order of the peak times have gone out of sync with the posteriors")
+                # Mapped, so the only copy made is the one in the final dtype
+                values = np.load(f"{path}/{meta['columns'].index(column)}.npy", mmap_mode='r')
+                data[column] = values.astype(self.dtypes.posterior_dtype(column, values.dtype))
+        return pd.DataFrame(data, index=pd.RangeIndex(meta['n']), copy=False), meta
+
+    def posteriors(self,eventname, peaks=False, f_ref=20.0, f_low=20.0, columns=None, precision=None, samples=None):
+        """
+        Returns a dataframe of the posterior samples of the event.
+
+        If columns is given only those parameters are read from disk (plus,
+        when peaks=True, the peak_columns the peak times are calculated from
+        and checked against, which are left out of the result).
+
+        With column_cache=True, the first load also writes the normalised
+        table to a columnar cache (see write_cache), which later loads read
+        instead of the posterior file, as long as the posterior file is
+        unchanged. Building it reads every column at full precision, unless
+        that is what was asked for anyway. Without it (the default) only
+        the requested columns are read, in the dtypes of the dtype policy.
+
+        precision is passed on to calculate_t_peaks when peak times still
+        need calculating. samples (a list of sample numbers, or an int for
+        the first samples) only returns those samples, so with peaks=True
+        only their peak times are calculated.
+        """
+        # Download the file if it doesn't exist
+        if not self.event_exists(eventname):
+            self.download_file(eventname)
+
+        if (columns is not None) and peaks:
+            # The peak times are hashed against, and calculated from, the
+            # peak_columns, so they are read along with the columns asked for
+            requested = list(columns)
+            columns = requested + [c for c in self.peak_inputs(eventname) if c not in requested]
+
+        cached = self.read_cache(eventname, columns) if self.column_cache else None
+        if cached is not None:
+            df_posteriors_all, info = cached
+        else:
+            df_posteriors_all, info = self.read_source(eventname, columns)
+            if self.column_cache:
+                # The table just read is cached as is if it is the full
+                # table at its stored precision
+                full = (columns is None) and (self.dtypes.posteriors is None) and (not self.dtypes.categorical)
+                self.write_cache(eventname, loaded=(df_posteriors_all, info) if full else None)
+        if info['f_ref'] is not None:
+            f_ref, f_low = info['f_ref'], info['f_low']
+
+        if peaks:
+            # The peak times are only used if they were calculated from
+            # these very samples, which calculate_t_peaks checks by hash
+            peak_df = self.calculate_t_peaks(eventname, f_ref=f_ref, f_low=f_low, precision=precision, samples=samples,
+                                             posteriors=df_posteriors_all)
+            if columns is not None:
+                extra = [c for c in columns if c not in requested]
+                df_posteriors_all = df_posteriors_all.drop(columns=extra)
+        if samples is not None:
+            df_posteriors_all = df_posteriors_all.iloc[select_samples(samples, len(df_posteriors_all))]
+        if peaks:
+            for i, column in enumerate(peak_df.columns):
+                df_posteriors_all.insert(i, column, peak_df[column].values)
 
         return df_posteriors_all
 
-    def calculate_t_peaks(self, event, f_low=20.0, f_ref=20.0, recalculate=False):
+    def peak_times_path(self, event):
+        return f"{self.folder}/PeakTimes/{event}.npz"
+
+    def legacy_peak_times_path(self, event):
+        # Peak times saved as csv, before they were saved with a hash
+        return f"{self.folder}/PeakTimes/{event}.csv"
+
+    def checkpoint_folder(self, event):
+        # Completed chunks of an unfinished peak time calculation
+        return f"{self.folder}/PeakTimes/{event}.chunks"
+
+    def read_checkpoints(self, event, posterior_hash):
+        folder = self.checkpoint_folder(event)
+        if not os.path.exists(folder):
+            return []
+        rows = []
+        for file in sorted(file for file in os.listdir(folder) if file.endswith('.npz')):
+            table, stored_hash = load_peak_table(f"{folder}/{file}")
+            if stored_hash == posterior_hash:
+                rows += table.to_dict('records')
+        return rows
+
+    def remove_checkpoints(self, event):
+        folder = self.checkpoint_folder(event)
+        if os.path.exists(folder):
+            for file in os.listdir(folder):
+                os.remove(f"{folder}/{file}")
+            os.rmdir(folder)
+
+    def write_checkpoint(self, event, rows, posterior_hash):
+        folder = self.checkpoint_folder(event)
+        os.makedirs(folder, exist_ok=True)
+        save_peak_table(f"{folder}/{rows[0]['sample_index']}-{rows[-1]['sample_index']}.npz",
+                        pd.DataFrame(rows), posterior_hash)
+
+    def read_legacy_peak_times(self, event, df_posteriors_all):
+        # Rows of a csv of peak times, if they still line up with the samples
+        stored = pd.read_csv(self.legacy_peak_times_path(event)).rename({'t_peak': 'geocent_peak'}, axis=1)
+        samples = df_posteriors_all.loc[stored['sample_index']]
+        masses_match = np.all(np.isclose(samples['final_mass'], stored['final_mass_check']))
+        spins_match = np.all(np.isclose(samples['final_spin'], stored['final_spin_check']))
+        if not (masses_match and spins_match):
+            print(f"The peak times in {self.legacy_peak_times_path(event)} don't match the posteriors, ignoring them")
+            return []
+        stored = stored.drop(columns=['final_mass_check', 'final_spin_check'])
+        if 'error' not in stored:
+            stored['error'] = None
+        return stored.to_dict('records')
+
+    def calculate_t_peaks(self, event, f_low=20.0, f_ref=20.0, recalculate=False, workers=1, chunk_size=256,
+                          samples=None, detectors=None, posteriors=None, precision=None):
+        """
+        Calculates the peak time of the waveform of every posterior sample,
+        at the geocenter and at each detector, and saves them in
+        PeakTimes/{event}.npz, along with the content hash of the posterior
+        samples they were calculated from. Saved peak times are only used
+        while that hash matches the posterior samples.
+
+        Samples are split into chunks of chunk_size samples, which run on
+        a pool of workers processes (in this process if workers=1). The
+        result is in sample order, indexed by sample_index. Samples whose
+        peak time can't be calculated get NaN peak times and the error in
+        the 'error' column.
+
+        Every completed chunk is checkpointed in PeakTimes/{event}.chunks/,
+        so an interrupted calculation picks up where it stopped. An existing
+        result is extended rather than recalculated: only the samples it is
+        missing get a waveform, and detectors it is missing are added from
+        the geocenter peak times and the sky positions.
+
+        Args:
+            samples (None, int or list of ints):
+                The samples to calculate, all of them by default, the first
+                samples ones if an int
+            detectors (None or list of strings):
+                Detectors to give peak times at, defaults to those with data
+            posteriors (None or pd.DataFrame):
+                The posterior samples of the event if already loaded, with
+                at least their peak_columns, so they aren't read again
+            precision (None or float):
+                None samples every waveform on a fixed 1/4096s grid. A
+                tolerance in seconds (e.g. 1e-4) uses the adaptive search of
+                complex_strain_peak_time_td instead, which is several times
+                faster for heavy systems. Saved peak times are reused
+                whatever precision they were calculated with, use
+                recalculate=True to redo them.
+        """
+        from tqdm import tqdm
+        from .peak import detector_peak_times
 
         # Create the t_peak directory if not already there
-        if not os.path.exists(f"{self.folder}/PeakTimes"):
-            subprocess.run(["mkdir", f"{self.folder}/PeakTimes"])
-
-        # Check if the file is there, if it is, just read and return
-        # it
-        if (not recalculate) and os.path.exists(f"{self.folder}/PeakTimes/{event}.csv"):
-            return pd.read_csv(f"{self.folder}/PeakTimes/{event}.csv")
-
-
-        # Get the posterior samples:
-        df_posteriors_all = self.posteriors(event)
-
-        print("Calculating the peak times for each sample. May take several minutes.")
-        print("Is only calculated once the first time you ask for it for a particular event")
-        print(f"Calculating for the event {event}")
-
-        # Calculate all t_peaks
-        calculated_times = []
-
-        for i,x in tqdm(df_posteriors_all.iterrows()):
-            my_dict = {}
-            try:
-                t_peak, t_dict, _, _ = complex_strain_peak_time_td(x.to_dict(), wf=int(x['waveform_code']),
-                                                                 dt=(1/4096), f_low=f_low, f_ref=f_ref)
-                t_dict = {(ifo+"_peak"):v for ifo,v in t_dict.items()}
-                my_dict.update(t_dict)
-                my_dict.update({"sample_index": i, 'final_mass_check': x['final_mass'], 'final_spin_check': x['final_spin']})
-            except:
-                t_dict = {(ifo+"_peak"):0.0 for ifo in ['geocent','H1','L1','V1']}
-                my_dict.update(t_dict)
-                my_dict.update({"sample_index": i, 'final_mass_check': x['final_mass'], 'final_spin_check': x['final_spin']})
-                print(f"Predictions failed for event {event}")
-            calculated_times.append(my_dict)
-
-        df_times = pd.DataFrame(calculated_times).rename({'geocent_peak': 't_peak'},axis=1)
-        df_times.set_index('sample_index',inplace=True)
-        df_times.to_csv(f"{self.folder}/PeakTimes/{event}.csv")
-        return df_times
+        os.makedirs(f"{self.folder}/PeakTimes", exist_ok=True)
+        if recalculate:
+            self.remove_checkpoints(event)
+            for path in [self.peak_times_path(event), self.legacy_peak_times_path(event)]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        # The posterior samples are only read if something needs calculating,
+        # and then only their peak_columns
+        if (posteriors is not None) and any(c not in posteriors for c in self.peak_inputs(event)):
+            posteriors = None
+        loaded = {'df': posteriors}
+        def posterior_samples():
+            if loaded['df'] is None:
+                loaded['df'] = self.posteriors(event, columns=self.peak_inputs(event))
+            return loaded['df']
+
+        # Peak times already calculated from these samples, in a finished
+        # result or in the checkpoints of an unfinished one
+        posterior_hash, n_samples = self.posterior_hash(event, posteriors)
+        calculated_times = self.read_checkpoints(event, posterior_hash)
+        changed = len(calculated_times) != 0
+        if os.path.exists(self.peak_times_path(event)):
+            stored, stored_hash = load_peak_table(self.peak_times_path(event))
+            if stored_hash == posterior_hash:
+                stored = stored.rename({'t_peak': 'geocent_peak'}, axis=1)
+                calculated_times = stored.to_dict('records') + calculated_times
+            else:
+                print(f"The posterior samples of {event} changed since its peak times were calculated")
+        elif os.path.exists(self.legacy_peak_times_path(event)):
+            calculated_times = self.read_legacy_peak_times(event, posterior_samples()) + calculated_times
+            changed = True
+        done = set(row['sample_index'] for row in calculated_times)
+
+        samples = select_samples(samples, n_samples)
+        todo = [i for i in samples if i not in done]
+        detectors = detectors if detectors is not None else self.available_detectors(event)
+
+        if len(todo) != 0:
+            changed = True
+            print("Calculating the peak times for each sample. May take several minutes.")
+            print("Is only calculated once the first time you ask for it for a particular event")
+            print(f"Calculating for the event {event} ({len(todo)} samples, {len(done)} already done)")
+
+            # Calculate the missing t_peaks, a chunk of samples at a time,
+            # saving each chunk as soon as it is done
+            records = posterior_samples().iloc[todo].to_dict('records')
+            chunks = [(todo[start:start + chunk_size], records[start:start + chunk_size], f_low, f_ref, precision)
+                      for start in range(0, len(todo), chunk_size)]
+            if workers > 1:
+                from concurrent.futures import ProcessPoolExecutor, as_completed
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(peak_times_chunk, chunk) for chunk in chunks]
+                    for future in tqdm(as_completed(futures), total=len(futures)):
+                        rows = future.result()
+                        self.write_checkpoint(event, rows, posterior_hash)
+                        calculated_times += rows
+            else:
+                for chunk in tqdm(chunks):
+                    rows = peak_times_chunk(chunk)
+                    self.write_checkpoint(event, rows, posterior_hash)
+                    calculated_times += rows
+
+            new = set(todo)
+            failed = [row for row in calculated_times if (row['sample_index'] in new) and (row['error'] is not None)]
+            if len(failed) != 0:
+                print(f"Predictions failed for {len(failed)} of {len(todo)} samples of event {event}, "
+                      f"e.g. sample {failed[0]['sample_index']}: {failed[0]['error']}")
+
+        df_times = pd.DataFrame(calculated_times).drop_duplicates('sample_index', keep='last')
+        df_times = df_times.set_index('sample_index').sort_index()
+        if 'geocent_peak' not in df_times:
+            df_times['geocent_peak'] = np.nan
+
+        # Detectors that weren't calculated are just a time delay away
+        # from the geocenter
+        for ifo in detectors:
+            missing = df_times[f"{ifo}_peak"].isnull() if f"{ifo}_peak" in df_times else np.ones(len(df_times), dtype=bool)
+            missing = np.asarray(missing) & np.asarray(df_times['geocent_peak'].notnull())
+            if (f"{ifo}_peak" not in df_times) or missing.any():
+                changed = True
+                sky = posterior_samples().loc[df_times.index[missing], ['ra', 'dec']]
+                values = df_times[f"{ifo}_peak"].values.copy() if f"{ifo}_peak" in df_times else np.full(len(df_times), np.nan)
+                values[missing] = detector_peak_times(df_times['geocent_peak'].values[missing], sky['ra'], sky['dec'], ifo)
+                df_times[f"{ifo}_peak"] = values
+
+        df_times = df_times.rename({'geocent_peak': 't_peak'},axis=1)
+        df_times = df_times[[c for c in df_times.columns if c != 'error'] + ['error']]
+        if changed:
+            # The finished result replaces the checkpoints
+            save_peak_table(self.peak_times_path(event), df_times.reset_index(), posterior_hash)
+            self.remove_checkpoints(event)
+        return df_times.loc[samples]
+
+    def get_psd_url(self, event):
+        return self.catalog.psd_url[event]
+
+    def psd_path(self, event):
+        # GWTC-1 PSDs are shipped separately from the posterior samples
+        file_type = self.get_psd_url(event).split('.')[-1]
+        return f"{self.folder}/{event}_psd.{file_type}"
+
+    def download_psd_file(self, event):
+        url = self.get_psd_url(event)
+        filename = self.psd_path(event).split('/')[-1]
+        thefile = File.from_url(url, self.folder, new_filename=filename)
+        self.register_file(event, thefile.path, product='psd')
+        return thefile
 
     def psd(self, event, detector=None):
+        from .PSDClasses import PSD
         # Return all detectors if none available
         if detector is None:
             detector = self.available_detectors(event)
 
         # If the event is GWTC-1, there is a seperate PSD file that needs to be downloaded
         if self.in_GWTC1(event):
-            url = self.psd_url_df.loc[self.psd_url_df.event == event, 'url'].values[0]
-            file_type = url.split('.')[-1]
-            filename = f"{event}_psd.{file_type}"
-            filepath = f"{self.folder}/{filename}"
+            filepath = self.psd_path(event)
             if not os.path.exists(filepath):
                 # Download the psd file
-                thefile = File.from_url(url, self.folder, new_filename=filename)
+                self.download_psd_file(event)
 
             psd_samples = pd.read_csv(filepath, delimiter='\t')
             renaming = {'# Freq (Hz)': 'freq', 'LIGO_Hanford_PSD (1/Hz)': 'H1', 'LIGO_Livingston_PSD (1/Hz)': 'L1', 'Virgo_PSD (1/Hz)': 'V1'}
@@ -346,13 +901,7 @@ class PosteriorDatabase:
             psd_vals = self.read_data(event, 'psd', detector=detector)
             return PSD(psd_vals[:,1], index=psd_vals[:,0])
 
-    @staticmethod
-    def preprocess_path(path, replacement_dict):
-        rep = lambda x: '' if x is None else x
-        replacements = { ("{"+key+"}"): rep(value) for key,value in replacement_dict.items() }
-        for key, value in replacements.items():
-            path = path.replace(key,value)
-        return path
+    preprocess_path = staticmethod(preprocess_path)
             
     def read_data_from_file(self, file, scheme, replacement_dict):
         path = self.preprocess_path(scheme['path'], replacement_dict)
@@ -376,102 +925,110 @@ class PosteriorDatabase:
         if approximant is None:
             approximant = self.choose_approximant(event)
         replacement_dict = {'event': event, 'approximant': approximant, 'detector':detector}
-        with h5py.File(file, 'r') as f:
-            scheme = self.schema[data_name]
+        scheme = self.schema[data_name]
+        with self.pool.borrow(file) as f:
             result = self.read_data_from_file(f, scheme, replacement_dict)
         return result
 
+    def read_schema(self, event, data_names, detectors=None, approximant=None):
+        """
+        Reads several schema entries for several detectors in one pass
+        over the event's posterior file, see StrainDatabase.read_schema
+        """
+        if detectors is None:
+            detectors = self.available_detectors(event)
+        if approximant is None:
+            approximant = self.choose_approximant(event)
+        ifos = [detectors] if isinstance(detectors, str) else detectors
+        replacement_dict = {'event': event, 'approximant': approximant}
+        plan = plan_schema_reads(self.schema, data_names, self.event_path(event), replacement_dict, ifos)
+        result = execute_schema_reads(self.pool, plan)
+        if isinstance(detectors, str):
+            result = select_detector(result, detectors)
+        return result
+
     def check_data_exists(self, event, data_name, approximant=None, detector=None):
         file_type = self.get_file_extension(event)
         file = f"{self.folder}/{event}.{file_type}"
         if approximant is None:
             approximant = self.choose_approximant(event)
         replacement_dict = {'event': event, 'approximant': approximant, 'detector':detector}
-        with h5py.File(file, 'r') as f:
-            scheme = self.schema[data_name]
+        scheme = self.schema[data_name]
+        with self.pool.borrow(file) as f:
             result = self.check_data_from_file(f, scheme, replacement_dict)
         return result
 
 
+# The columns the peak time of a sample depends on, plus final_mass which
+# legacy csv peak times are checked against
+peak_columns = ['mass_1', 'mass_2', 'spin_1x', 'spin_1y', 'spin_1z', 'spin_2x', 'spin_2y', 'spin_2z',
+                'luminosity_distance', 'iota', 'phase', 'geocent_time', 'ra', 'dec', 'final_mass', 'final_spin']
 
+def hash_table(df):
+    # Content hash of a table of samples: the names and values of its
+    # peak_columns. Times are hashed at float64 and everything else at
+    # float32, so the table hashes the same whichever dtype policy read it.
+    digest = hashlib.blake2b(digest_size=16)
+    for column in [c for c in peak_columns if c in df.columns]:
+        digest.update(column.encode())
+        values = np.asarray(df[column].values, dtype=np.float64 if 'time' in column else np.float32)
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
 
-class PSD(PowerSpectrum):
-    def __init__(self, *args, **kwargs):
-        super(PSD, self).__init__(*args, **kwargs)
+def save_peak_table(path, table, posterior_hash):
+    # One array per column plus the hash of the posterior samples the peak
+    # times were calculated from, written atomically
+    arrays = {}
+    for column in table.columns:
+        values = table[column].values
+        if values.dtype == object:
+            values = np.array(['' if (v is None) or (v != v) else str(v) for v in values])
+        arrays[column] = values
+    with open(f"{path}.part", 'wb') as file:
+        np.savez(file, posterior_hash=np.array(posterior_hash), **arrays)
+    os.replace(f"{path}.part", path)
 
-    @property
-    def _constructor(self):
-        return PSD
-
-    def plot(self):
-        """
-        Do a loglog plot of the powerspectrum
-        """
-        fig, ax = plt.subplots()
-        ax.loglog(self)
-        plt.show()
-
-    @property
-    def bin_sizes(self):
-        """
-        Plot the bin sizes of each frequency bin, to detect if there
-        are any inconsistencies in the bin sizes
-        """
-        return pd.Series(self.freq[1:-1] - self.freq[0:-2], index=self.freq[0:-2])
-
-    def low_pad(self, from_freq=None, to_freq=0.0, val=None):
-        """
-        Pads the power spectrum from from_freq to to_freq
-        with the value val or
-        """
-        # Set parameter values
-        df = self.delta_f
-        freq = self.freq
-        from_freq = from_freq or freq.min()
-
-        # Set fill value and lowest new freq bin
-        fill_value = val or self[from_freq]
-        new_lowest_freq_bin = to_freq if to_freq < freq.min() else freq.min()
-
-        new_index = np.append(np.arange(new_lowest_freq_bin, from_freq, df), freq)
-        new_index = np.array(list(set(new_index)))
-        new_index.sort()
-
-        # Reindex the series and replace the value with the set value
-        # or the default value, which is the one at freq_from
-        a = self.copy()
-        a[a.freq < from_freq] = fill_value
-        return a.reindex(new_index, fill_value=fill_value)
-
-    def high_pad(self, from_freq=None, to_freq=None, val=None, inclusive=True):
-        """
-        Pads the power spectrum in such way that all frequency bins 
-        above from_freq get assigned the power at from_freq.
-        
-        The default behaviour is to extend the frequency indices all the 
-        way up to the next power of two
-        """
-        # Set parameter values
-        df = self.delta_f
-        freq = self.freq
-        from_freq = from_freq or freq.max()
-        df_end = df if inclusive else 0.0
-
-        # Set fill value and lowest new freq bin
-        fill_value = val or self[from_freq]
-        next_pow_of_2 = int(2**np.ceil(np.log(freq.max())/np.log(2)))
-        new_highest_freq_bin = next_pow_of_2 if to_freq is None else to_freq
-
-        # Create new index
-        new_index = np.append(freq, np.arange(from_freq, new_highest_freq_bin + df_end, df))
-        new_index = np.array(list(set(new_index).union(set([new_highest_freq_bin]))))
-        new_index.sort()
-
-        # Reindex the series and replace the value with the set value
-        # or the default value, which is the one at freq_from
-        a = self.copy()
-        a[from_freq::] = fill_value 
-        return a.reindex(new_index, fill_value=fill_value)
+def load_peak_table(path):
+    with np.load(path) as stored:
+        posterior_hash = str(stored['posterior_hash'])
+        table = pd.DataFrame({column: stored[column] for column in stored.files if column != 'posterior_hash'})
+    if 'error' in table:
+        table['error'] = table['error'].astype(object).where(table['error'] != '', None)
+    return table, posterior_hash
 
+def select_samples(samples, n):
+    # Sorted sample numbers out of n samples: all of them for None, the
+    # first ones for an int
+    if samples is None:
+        return list(range(n))
+    if isinstance(samples, (int, np.integer)):
+        return list(range(min(samples, n)))
+    return sorted(set(samples))
 
+def peak_times_chunk(chunk):
+    """
+    Peak times of a chunk of posterior samples, given as (sample indices,
+    samples as dictionaries, f_low, f_ref, precision). Runs in the worker processes
+    of calculate_t_peaks, so it lives at module level.
+    """
+    indices, samples, f_low, f_ref, precision = chunk
+    rows = []
+    for i, x in zip(indices, samples):
+        my_dict = {"sample_index": i, 'error': None}
+        try:
+            t_peak, t_dict, _, _ = complex_strain_peak_time_td(x, wf=int(x['waveform_code']),
+                                                             dt=(1/4096), f_low=f_low, f_ref=f_ref,
+                                                             precision=precision)
+            my_dict.update({(ifo+"_peak"):v for ifo,v in t_dict.items()})
+        except Exception as e:
+            my_dict['error'] = repr(e)
+        rows.append(my_dict)
+    return rows
 
+def __getattr__(name):
+    # PSD subclasses ringdown.PowerSpectrum, and importing ringdown is slow,
+    # so the class is only loaded the first time it is asked for
+    if name == 'PSD':
+        from .PSDClasses import PSD
+        return PSD
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
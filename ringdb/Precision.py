@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+
+class DtypePolicy:
+    """
+    Which dtypes strain and posterior samples are loaded as.
+
+    The default policy loads everything as stored (float64). The 'compact'
+    policy, meant for holding the posteriors of the whole catalog in memory,
+    loads:
+        strain:            float32
+        posterior columns: float32, except time-critical columns
+        waveform columns:  pandas categoricals instead of a string and an
+                           int repeated on every row
+
+    Conversions happen while reading (inside HDF5 for .h5 files), so no
+    float64 copy of the data is ever made.
+
+    Precision contract:
+        - float32 keeps ~7 significant digits (relative error < 6e-8), which
+          is far below the statistical spread of any posterior or the noise
+          in the strain.
+        - A GPS time of ~1.3e9 s in float32 is only resolved to ~64 s, so
+          any column with 'time' in its name (geocent_time, H1_time, ...)
+          and the columns listed in exact always stay float64, as do the
+          peak times added by posteriors(peaks=True).
+        - Integer and other non-float columns are never converted.
+        - Memory mapped strain (strain(mmap=True)) is returned as stored.
+    """
+    exact_columns = ('geocent_time',)
+
+    def __init__(self, strain=None, posteriors=None, exact=None, categorical=False):
+        self.strain = None if strain is None else np.dtype(strain)
+        self.posteriors = None if posteriors is None else np.dtype(posteriors)
+        self.exact = tuple(exact) if exact is not None else self.exact_columns
+        self.categorical = categorical
+
+    @classmethod
+    def compact(cls):
+        return cls(strain='float32', posteriors='float32', categorical=True)
+
+    @classmethod
+    def resolve(cls, dtype):
+        # Database(dtype=...) takes None, a DtypePolicy or the name of a preset
+        if dtype is None:
+            return cls()
+        if isinstance(dtype, cls):
+            return dtype
+        presets = {'float64': cls, 'compact': cls.compact}
+        if dtype not in presets:
+            raise ValueError(f"Unknown dtype policy {dtype}, choose from {list(presets)} or pass a DtypePolicy")
+        return presets[dtype]()
+
+    def is_exact(self, column):
+        return (column in self.exact) or ('time' in column)
+
+    def posterior_dtype(self, column, stored):
+        # dtype a posterior column stored as the dtype stored is loaded as
+        stored = np.dtype(stored)
+        if (self.posteriors is None) or (stored.kind != 'f') or self.is_exact(column):
+            return stored
+        return self.posteriors
+
+    def strain_dtype(self, stored):
+        stored = np.dtype(stored)
+        if (self.strain is None) or (stored.kind != 'f'):
+            return stored
+        return self.strain
+
+    def waveform_columns(self, n, waveform_name, waveform_code):
+        if not self.categorical:
+            return {'waveform_name': waveform_name, 'waveform_code': waveform_code}
+        codes = np.zeros(n, dtype=np.int8)
+        return {'waveform_name': pd.Categorical.from_codes(codes, [waveform_name]),
+                'waveform_code': pd.Categorical.from_codes(codes, [waveform_code])}
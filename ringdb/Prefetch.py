@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+
+class PrefetchJob:
+    """
+    A single download that warms the local store. Several (event, product)
+    requests can map onto the same job, e.g. every GWTC-1 event is served
+    by the same archive, so the job is keyed by what actually gets downloaded.
+    """
+    def __init__(self, key, urls, run, outputs):
+        self.key = key
+        self.urls = urls
+        self.run = run
+        self.outputs = outputs
+        self.events = []
+
+    @property
+    def host(self):
+        return urlparse(self.urls[0]).netloc
+
+    @property
+    def size(self):
+        return sum(os.path.getsize(f) for f in self.outputs() if os.path.exists(f))
+
+
+class Prefetcher:
+    def __init__(self, database, workers=8, per_host=4):
+        self.DB_ref = database
+        self.PD_ref = database.PosteriorDB
+        self.SD_ref = database.StrainDB
+        self.workers = workers
+        self.per_host = per_host
+        self._host_locks = {}
+        self._lock = threading.Lock()
+
+    def host_semaphore(self, host):
+        with self._lock:
+            if host not in self._host_locks:
+                self._host_locks[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_locks[host]
+
+    def strain_job(self, event, duration):
+        if self.SD_ref.event_present(event, duration=duration):
+            return None
+        urls = [self.SD_ref.get_url(event, ifo, duration) for ifo in self.SD_ref.available_detectors(event)]
+        return PrefetchJob(key=('strain', event, duration), urls=urls,
+                           run=lambda: self.SD_ref.make_event_file(event, duration=duration),
+                           outputs=lambda: [f"{self.SD_ref.folder}/{event}.hdf5"])
+
+    def posterior_job(self, event):
+        if self.PD_ref.event_exists(event):
+            return None
+        url = self.PD_ref.get_url(event)
+        # Events sharing an archive are all extracted in the one job
+        job = PrefetchJob(key=('posteriors', url), urls=[url], run=None, outputs=None)
+        job.run = lambda: self.PD_ref.download_file(job.events[0], events=job.events)
+        job.outputs = lambda: [self.PD_ref.event_path(e) for e in job.events]
+        return job
+
+    def psd_job(self, event):
+        # Only GWTC-1 events have separate PSD files, the rest of the
+        # PSDs live inside the posterior files
+        if not self.PD_ref.in_GWTC1(event):
+            return self.posterior_job(event)
+        if os.path.exists(self.PD_ref.psd_path(event)):
+            return None
+        url = self.PD_ref.get_psd_url(event)
+        return PrefetchJob(key=('psd', url), urls=[url],
+                           run=lambda: self.PD_ref.download_psd_file(event),
+                           outputs=lambda: [self.PD_ref.psd_path(event)])
+
+    def plan(self, events, products=("strain", "psd", "posteriors"), duration=32.0):
+        """
+        Returns the de-duplicated list of jobs needed to have every product
+        of every event present locally
+        """
+        builders = {'strain': lambda e: self.strain_job(e, duration),
+                    'posteriors': self.posterior_job,
+                    'psd': self.psd_job}
+        jobs = {}
+        for product in products:
+            if product not in builders:
+                raise ValueError(f"Unknown product {product}, choose from {list(builders)}")
+            for event in events:
+                job = builders[product](event)
+                if job is None:
+                    continue
+                job = jobs.setdefault(job.key, job)
+                if event not in job.events:
+                    job.events.append(event)
+        return list(jobs.values())
+
+    def _run_job(self, job):
+        with self.host_semaphore(job.host):
+            start = time.time()
+            job.run()
+            return time.time() - start
+
+    def run(self, events, products=("strain", "psd", "posteriors"), duration=32.0):
+        from tqdm import tqdm
+        jobs = self.plan(events, products=products, duration=duration)
+        start = time.time()
+        summary = {'requested': len(events) * len(products), 'jobs': len(jobs),
+                   'completed': 0, 'failed': {}, 'bytes': 0}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._run_job, job): job for job in jobs}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                job = futures[future]
+                try:
+                    future.result()
+                    summary['completed'] += 1
+                    summary['bytes'] += job.size
+                except Exception as e:
+                    summary['failed'][job.key] = repr(e)
+
+        summary['elapsed'] = time.time() - start
+        summary['throughput'] = summary['bytes'] / summary['elapsed'] if summary['elapsed'] > 0 else 0.0
+
+        print(f"Prefetched {summary['completed']}/{summary['jobs']} downloads "
+              f"({summary['requested']} event products requested) in {summary['elapsed']:.1f}s")
+        print(f"Downloaded {summary['bytes']/1e6:.1f} MB at {summary['throughput']/1e6:.2f} MB/s")
+        for key, error in summary['failed'].items():
+            print(f"Failed {key}: {error}")
+        return summary
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+
+def preprocess_path(path, replacement_dict):
+    rep = lambda x: '' if x is None else x
+    replacements = { ("{"+key+"}"): rep(value) for key,value in replacement_dict.items() }
+    for key, value in replacements.items():
+        path = path.replace(key,value)
+    return path
+
+def read_scheme(obj, scheme):
+    # obj is the dataset or group the scheme's path resolved to
+    if scheme['type'] == 'attribute':
+        return obj.attrs[scheme['name']]
+    elif scheme['type'] == 'array':
+        return obj[:]
+    elif scheme['type'] == 'value':
+        return obj[()]
+    return None
+
+def plan_schema_reads(schema, data_names, file, replacement_dict, detectors):
+    """
+    Resolves every requested schema entry, for every detector if its path
+    depends on the detector, into a (data_name, detector, file, path, scheme)
+    read. Entries whose path has no {detector} get detector None.
+    """
+    plan = []
+    for data_name in data_names:
+        scheme = schema[data_name]
+        ifos = detectors if "{detector}" in scheme['path'] else [None]
+        for ifo in ifos:
+            new_replacement_dict = replacement_dict.copy()
+            new_replacement_dict['detector'] = ifo
+            path = preprocess_path(scheme['path'], new_replacement_dict)
+            plan.append((data_name, ifo, file, path, scheme))
+    return plan
+
+def execute_schema_reads(pool, plan):
+    """
+    Carries out a plan from plan_schema_reads, opening each file once and
+    looking each internal path up once, however many entries live there.
+
+    Returns a dictionary labelled by data name, holding a dictionary
+    labelled by detector for entries that depend on the detector.
+    """
+    by_file = OrderedDict()
+    for read in plan:
+        by_file.setdefault(read[2], []).append(read)
+
+    result = {}
+    for file, reads in by_file.items():
+        with pool.borrow(file) as f:
+            objects = {}
+            for data_name, ifo, _, path, scheme in reads:
+                if path not in objects:
+                    objects[path] = f[path]
+                value = read_scheme(objects[path], scheme)
+                if ifo is None:
+                    result[data_name] = value
+                else:
+                    result.setdefault(data_name, {})[ifo] = value
+    return result
+
+def select_detector(result, detector):
+    # Collapse the per-detector dictionaries when a single detector was asked for
+    return {data_name: (value[detector] if isinstance(value, dict) else value)
+            for data_name, value in result.items()}
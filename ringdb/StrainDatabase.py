@@ -5,6 +5,11 @@ import pandas as pd
 import numpy as np
 import h5py
 from . import File
+from .Catalog import URLCatalog
+from .Manifest import Manifest
+from .H5Pool import default_pool
+from .Precision import DtypePolicy
+from .Schema import preprocess_path, plan_schema_reads, execute_schema_reads, select_detector
 
 default_schema = {'sample' : {'type': 'array', 'path': '{detector}/strain/Strain'},
                   't0': {'type': 'attribute', 'name': 'Xstart', 'path': '{detector}/strain/Strain'},
@@ -13,63 +18,122 @@ default_schema = {'sample' : {'type': 'array', 'path': '{detector}/strain/Strain
                  }
         
 class StrainDatabase:
-    def __init__(self, folder, url_df, schema=default_schema):
+    # Samples per hyperslab when copying or converting strain datasets, so
+    # neither ever holds more than one slab in a temporary buffer
+    slab_size = 1 << 20
+
+    def __init__(self, folder, url_df, schema=default_schema, catalog=None, pool=None, dtypes=None):
         self.url_df = url_df
+        self.catalog = catalog or URLCatalog(strain_url_df=url_df)
         if folder[-1] == '/':
             folder = folder[:-1]
         self.folder = folder
         self.schema = schema
+        self._manifest = None
+        self.pool = pool if pool is not None else default_pool
+        self.dtypes = dtypes if dtypes is not None else DtypePolicy()
         
     def available_detectors(self, event):
-        return list(self.url_df[self.url_df.Event == event].Detector.unique())
+        return list(self.catalog.detectors.get(event, []))
         
+    @property
+    def manifest(self):
+        if (self._manifest is None) or (self._manifest.folder != self.folder):
+            self._manifest = Manifest(self.folder)
+            if self._manifest.is_new:
+                self.register_existing_files()
+        return self._manifest
+
+    def register_file(self, event, path, duration=None):
+        self.pool.invalidate(path)
+        with self.pool.borrow(path) as f:
+            detectors = list(f.keys())
+            if (duration is None) and (len(detectors) > 0) and (f"{detectors[0]}/meta/Duration" in f):
+                duration = float(f[f"{detectors[0]}/meta/Duration"][()])
+        self.manifest.add(event, 'strain', path, detectors=detectors, duration=duration)
+
+    def register_existing_files(self):
+        # Data folders filled before the manifest existed
+        for file in os.listdir(self.folder):
+            event, _, file_type = file.partition('.')
+            if (file_type == 'hdf5') and (event in self.catalog.detectors):
+                self.register_file(event, f"{self.folder}/{file}")
+
+    def event_present(self, event, duration=None):
+        # (with a duration, only strain of that duration counts)
+        if self.manifest.contains(event, 'strain', duration=duration):
+            return True
+        # Pick up files that were placed in the folder by hand
+        filepath = f"{self.folder}/{event}.hdf5"
+        if os.path.exists(filepath) and not self.manifest.contains(event, 'strain'):
+            self.register_file(event, filepath)
+            return self.manifest.contains(event, 'strain', duration=duration)
+        return False
+
     @property
     def events_present(self):
-        files = os.listdir(self.folder)
-        files = [f.split('.')[0] for f in files if f[0] != "."] # Keep only those that aren't hidden
-        return files
+        return self.manifest.events('strain')
     
     def get_url(self, event, detector, duration=32.0):
-        mask = (self.url_df.Event == event) & (self.url_df.Detector == detector) & (self.url_df.Duration == duration)
-        url = self.url_df.loc[mask,'Url'].values[0]
-        return url
+        return self.catalog.strain_url[(event, detector, float(duration))]
     
     def download_file(self, event, detector, duration=32.0):
         url = self.get_url(event, detector, duration)
         thefile = File.from_url(url, self.folder, new_filename=f"{event}-{detector}.hdf5") 
         return thefile
         
-    def combine_detector_files(self, event, detector_files):
-        # Create a new hdf5 file called {event}.hdf5
+    @staticmethod
+    def copy_contiguous(source, dest):
+        # Copy a group, storing every dataset uncompressed and contiguous
+        # so that it can be memory mapped
+        for key, value in source.attrs.items():
+            dest.attrs[key] = value
+        for name, obj in source.items():
+            if isinstance(obj, h5py.Group):
+                StrainDatabase.copy_contiguous(obj, dest.create_group(name))
+            elif obj.ndim == 0:
+                dataset = dest.create_dataset(name, data=obj[()])
+            else:
+                # A hyperslab at a time, so the whole dataset is never in memory
+                dataset = dest.create_dataset(name, shape=obj.shape, dtype=obj.dtype)
+                for start in range(0, obj.shape[0], StrainDatabase.slab_size):
+                    stop = min(start + StrainDatabase.slab_size, obj.shape[0])
+                    dataset[start:stop] = obj[start:stop]
+            if isinstance(obj, h5py.Dataset):
+                for key, value in obj.attrs.items():
+                    dataset.attrs[key] = value
+
+    def combine_detector_files(self, event, detector_files, contiguous=False):
+        # Create a new hdf5 file called {event}.hdf5, closing any handle
+        # to an earlier version of it first
+        self.pool.invalidate(f'{self.folder}/{event}.hdf5')
         with h5py.File(f'{self.folder}/{event}.hdf5','w') as f:
             for ifo, detector_file in detector_files.items():
                 
                 # Open the downloaded detector strains
-                file = h5py.File(detector_file.path,'r') 
+                with h5py.File(detector_file.path,'r') as file:
                 
-                # Copy each file into the newly created hdf5 under an internal path like /H1 or /L1
-                h5py.h5o.copy(file.id, b"/", f.id, f"/{ifo}".encode()) 
+                    # Copy each file into the newly created hdf5 under an internal path like /H1 or /L1
+                    if contiguous:
+                        self.copy_contiguous(file, f.create_group(ifo))
+                    else:
+                        h5py.h5o.copy(file.id, b"/", f.id, f"/{ifo}".encode())
         
-    def make_event_file(self, event, duration=32.0):
+    def make_event_file(self, event, duration=32.0, contiguous=False):
         # Download all the events available
         files = {}
         for ifo in self.available_detectors(event):
             files[ifo] = self.download_file(event, ifo, duration=duration)
             
         # Combine them into one file named {event}.hdf5
-        self.combine_detector_files(event, files)
+        self.combine_detector_files(event, files, contiguous=contiguous)
+        self.register_file(event, f"{self.folder}/{event}.hdf5", duration=duration)
         
         # Delete the downloaded detector files:
         for ifo, file in files.items():
             file.delete()
     
-    @staticmethod
-    def preprocess_path(path, replacement_dict):
-        rep = lambda x: '' if x is None else x
-        replacements = { ("{"+key+"}"): rep(value) for key,value in replacement_dict.items() }
-        for key, value in replacements.items():
-            path = path.replace(key,value)
-        return path
+    preprocess_path = staticmethod(preprocess_path)
             
     def read_data_from_file(self, file, scheme, replacement_dict):
         path = self.preprocess_path(scheme['path'], replacement_dict)
@@ -86,36 +150,127 @@ class StrainDatabase:
     def read_data(self, event, detector, data_name):
         file = f"{self.folder}/{event}.hdf5"
         replacement_dict = {'event': event, 'detector': detector}
-        with h5py.File(file, 'r') as f:
-            scheme = self.schema[data_name]
+        scheme = self.schema[data_name]
+        with self.pool.borrow(file) as f:
             result = self.read_data_from_file(f, scheme, replacement_dict)
         return result
             
-    def strain(self, event, detectors=None, duration=32.0):
+    def read_schema(self, event, data_names, detectors=None):
+        """
+        Reads several schema entries for several detectors in one pass
+        over the event's strain file.
+
+        Returns a dictionary labelled by data name, each holding a dictionary
+        labelled by detector (or just the value, if detectors is a string
+        or the entry doesn't depend on the detector)
+        """
+        if detectors is None:
+            detectors = self.available_detectors(event)
+        ifos = [detectors] if isinstance(detectors, str) else detectors
+        plan = plan_schema_reads(self.schema, data_names, f"{self.folder}/{event}.hdf5", {'event': event}, ifos)
+        result = execute_schema_reads(self.pool, plan)
+        if isinstance(detectors, str):
+            result = select_detector(result, detectors)
+        return result
+
+    @staticmethod
+    def window_indices(t0, dt, n, t_start=None, t_end=None):
+        # Index of the first sample at or after t, rounding off float noise
+        first = lambda t: int(np.ceil(np.round((t - t0)/dt, 6)))
+        i0 = 0 if t_start is None else min(max(first(t_start), 0), n)
+        i1 = n if t_end is None else min(max(first(t_end), i0), n)
+        return i0, i1
+
+    def read_window(self, event, detector, t0, dt, t_start=None, t_end=None):
+        """
+        Reads only the strain samples with t_start <= t < t_end, as a
+        hyperslab of the strain dataset, in the dtype of the dtype policy.
+        Returns the samples and the time of the first one.
+        """
+        path = self.preprocess_path(self.schema['sample']['path'], {'event': event, 'detector': detector})
+        with self.pool.borrow(f"{self.folder}/{event}.hdf5") as f:
+            dataset = f[path]
+            i0, i1 = self.window_indices(t0, dt, dataset.shape[0], t_start, t_end)
+            return self.read_slabs(dataset, i0, i1, self.dtypes.strain_dtype(dataset.dtype)), t0 + i0*dt
+
+    @staticmethod
+    def read_slabs(dataset, i0, i1, dtype):
+        # dataset[i0:i1] converted to dtype, read straight into the result a
+        # hyperslab at a time so HDF5's conversion buffer stays bounded
+        out = np.empty((i1 - i0,) + dataset.shape[1:], dtype=dtype)
+        for start in range(i0, i1, StrainDatabase.slab_size):
+            stop = min(start + StrainDatabase.slab_size, i1)
+            dataset.read_direct(out, np.s_[start:stop], np.s_[start - i0:stop - i0])
+        return out
+
+    def memory_map(self, event, detector):
+        """
+        Returns a read-only numpy.memmap over the strain samples, if the
+        dataset is stored contiguously and uncompressed (see
+        combine_detector_files(contiguous=True)), otherwise None.
+
+        Every process mapping the same file shares the operating system's
+        page cache instead of holding its own copy of the strain.
+        """
+        filepath = f"{self.folder}/{event}.hdf5"
+        path = self.preprocess_path(self.schema['sample']['path'], {'event': event, 'detector': detector})
+        with self.pool.borrow(filepath) as f:
+            dataset = f[path]
+            offset = dataset.id.get_offset()
+            if (dataset.chunks is not None) or (dataset.compression is not None) or (offset is None):
+                return None
+            return np.memmap(filepath, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+
+    def strain(self, event, detectors=None, duration=32.0, t_start=None, t_end=None, around=None, width=None, mmap=False, compact=False):
         # Download the file if the file doesn't exist
-        if event not in self.events_present:
-            self.make_event_file(event, duration=duration)
+        # (stored contiguously if it is going to be memory mapped)
+        if not self.event_present(event, duration=duration):
+            self.make_event_file(event, duration=duration, contiguous=mmap)
             
         # Prepare which detectors which need to be returned
         if detectors is None:
             detectors = self.available_detectors(event)
+
+        # Only read a window of the strain if one is asked for
+        if around is not None:
+            if width is None:
+                raise ValueError("Provide the width of the window around the time")
+            t_start, t_end = around - width/2, around + width/2
+        # Reads converting to another dtype go through read_window too
+        windowed = (t_start is not None) or (t_end is not None) or (self.dtypes.strain is not None)
             
         # Grab the data you need from the detectors you need
-        filepath = f"{self.folder}/{event}.hdf5"
-        
-        if isinstance(detectors,list):
-            # If you pass a list of detectors, or None, you'll get a dictionary of Data objects
-            strain = {}
-            for ifo in detectors:
-                h  = self.read_data(event, ifo, 'sample')
-                t0 = self.read_data(event, ifo, 't0')
-                dt = self.read_data(event, ifo, 'dt')
-                strain[ifo] = ringdown.Data(h, index=t0 + dt*np.arange(len(h)), ifo=ifo)
+        # If you pass a list of detectors, or None, you'll get a dictionary of Data objects
+        # If you pass just one detector string you'll get one data object
+        ifos = detectors if isinstance(detectors,list) else [detectors]
+        mapped = {ifo: self.memory_map(event, ifo) for ifo in ifos} if mmap else {}
+        mapped = {ifo: h for ifo, h in mapped.items() if h is not None}
+        if len(mapped) != 0:
+            # Memory mapped detectors are sliced without reading anything,
+            # the rest fall back to reading from the file
+            data = self.read_schema(event, ['t0', 'dt'], detectors=ifos)
+            data['sample'] = {}
+            for ifo in ifos:
+                t0, dt = data['t0'][ifo], data['dt'][ifo]
+                if ifo in mapped:
+                    i0, i1 = self.window_indices(t0, dt, len(mapped[ifo]), t_start, t_end)
+                    data['sample'][ifo], data['t0'][ifo] = mapped[ifo][i0:i1], t0 + i0*dt
+                else:
+                    data['sample'][ifo], data['t0'][ifo] = self.read_window(event, ifo, t0, dt, t_start, t_end)
+        elif windowed:
+            data = self.read_schema(event, ['t0', 'dt'], detectors=ifos)
+            data['sample'] = {}
+            for ifo in ifos:
+                data['sample'][ifo], data['t0'][ifo] = self.read_window(event, ifo, data['t0'][ifo], data['dt'][ifo], t_start, t_end)
         else:
-            # If you pass just one detector string you'll get one data object
-            h  = self.read_data(event, detectors, 'sample')
-            t0 = self.read_data(event, detectors, 't0')
-            dt = self.read_data(event, detectors, 'dt')
-            strain = ringdown.Data(h, index=t0 + dt*np.arange(len(h)), ifo=detectors)
-        return strain
+            data = self.read_schema(event, ['sample', 't0', 'dt'], detectors=ifos)
 
+        strain = {}
+        for ifo in ifos:
+            h, t0, dt = data['sample'][ifo], data['t0'][ifo], data['dt'][ifo]
+            if compact:
+                # Time stamps stay implicit, t0 + dt*index
+                strain[ifo] = ringdown.Data(h, t0=t0, dt=dt, ifo=ifo, copy=False)
+            else:
+                strain[ifo] = ringdown.Data(h, index=t0 + dt*np.arange(len(h)), ifo=ifo, copy=False)
+        return strain if isinstance(detectors,list) else strain[detectors]
@@ -0,0 +1,125 @@
+import os
+import time
+import socket
+import sqlite3
+from contextlib import closing
+import pandas as pd
+
+
+class WorkQueue:
+    """
+    Persistent queue of per-event jobs, kept as an SQLite file inside a
+    data folder, that several processes (or nodes sharing the folder) drain
+    together without doing the same event twice.
+
+    Each event has one row holding its status ('pending', 'running', 'done'
+    or 'failed'), the worker that last claimed it, when it started and
+    finished, how long it took, and how many attempts and failures it has
+    had along with the last error. Claiming an event is a single write
+    transaction, so two workers never claim the same event. Failed events
+    are retried until they have failed max_failures times, and events left
+    'running' for longer than stale_after seconds (by a worker that died)
+    are handed out again.
+    """
+    columns = ['event', 'status', 'worker', 'started', 'finished', 'seconds', 'attempts', 'failures', 'error']
+
+    def __init__(self, folder, filename=".queue.sqlite"):
+        self.folder = folder
+        self.path = f"{folder.rstrip('/')}/{filename}"
+        with closing(self.connect()) as conn, conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                event TEXT PRIMARY KEY,
+                                status TEXT NOT NULL,
+                                worker TEXT,
+                                started REAL,
+                                finished REAL,
+                                seconds REAL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                failures INTEGER NOT NULL DEFAULT 0,
+                                error TEXT)""")
+
+    def connect(self):
+        # A fresh connection per call, so the queue is safe to use from
+        # several processes on the same folder
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def worker_name():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def add(self, events):
+        """
+        Queues events that aren't in the queue yet, leaving the status of
+        the others as it is
+        """
+        with closing(self.connect()) as conn, conn:
+            conn.executemany("INSERT OR IGNORE INTO jobs (event, status) VALUES (?, 'pending')",
+                             [(event,) for event in events])
+
+    def reset(self, events):
+        # Queue finished or failed events again, e.g. after their posterior
+        # files were updated; events being worked on are left alone
+        with closing(self.connect()) as conn, conn:
+            conn.executemany("""UPDATE jobs SET status = 'pending', failures = 0, error = NULL
+                                WHERE event = ? AND status IN ('done', 'failed')""",
+                             [(event,) for event in events])
+
+    def claim(self, events, worker=None, max_failures=3, stale_after=6*3600):
+        """
+        Marks the next event of events that is pending, failed fewer than
+        max_failures times, or abandoned while running, as running by this
+        worker, and returns it. Returns None once there is nothing left.
+        """
+        worker = worker or self.worker_name()
+        now = time.time()
+        events = list(events)
+        if len(events) == 0:
+            return None
+        with closing(self.connect()) as conn:
+            conn.isolation_level = None
+            # Takes the write lock before looking, so the check and the
+            # claim can't interleave with another worker's
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(f"""SELECT event FROM jobs
+                                       WHERE event IN ({','.join('?'*len(events))})
+                                         AND ((status = 'pending')
+                                              OR (status = 'failed' AND failures < ?)
+                                              OR (status = 'running' AND started < ?))
+                                       ORDER BY status = 'pending' DESC, failures, event
+                                       LIMIT 1""", events + [max_failures, now - stale_after]).fetchone()
+                if row is not None:
+                    conn.execute("""UPDATE jobs SET status = 'running', worker = ?, started = ?, finished = NULL,
+                                    seconds = NULL, attempts = attempts + 1 WHERE event = ?""", (worker, now, row[0]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return None if row is None else row[0]
+
+    def finish(self, event, seconds):
+        with closing(self.connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET status = 'done', finished = ?, seconds = ?, error = NULL WHERE event = ?",
+                         (time.time(), seconds, event))
+
+    def release(self, event):
+        # Hands an interrupted event back to the queue without counting a failure
+        with closing(self.connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET status = 'pending', attempts = attempts - 1 WHERE event = ?", (event,))
+
+    def fail(self, event, seconds, error):
+        with closing(self.connect()) as conn, conn:
+            conn.execute("""UPDATE jobs SET status = 'failed', finished = ?, seconds = ?, failures = failures + 1,
+                            error = ? WHERE event = ?""", (time.time(), seconds, error, event))
+
+    def status(self, events=None):
+        """
+        Returns a DataFrame with a row per queued event (only those in
+        events if given) and the columns in WorkQueue.columns
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute(f"SELECT {', '.join(self.columns)} FROM jobs ORDER BY event").fetchall()
+        df = pd.DataFrame(rows, columns=self.columns)
+        if events is not None:
+            df = df[df.event.isin(list(events))].reset_index(drop=True)
+        return df
@@ -6,8 +6,6 @@ from . import DataFrameClasses as ringdown
 import h5py
 import subprocess
 import os
-import lalsimulation as ls
-import tqdm
 
 try:
     import importlib.resources as pkg_resources
@@ -20,11 +18,21 @@ from .File import *
 from .StrainDatabase import *
 from .PosteriorDatabase import *
 from .Database import *
+from .Prefetch import *
+from .Catalog import *
+from .H5Pool import *
+from .Precision import *
+from .ObjectCache import *
 from .peak import *
 from . import File
 from . import StrainDatabase
 from . import PosteriorDatabase
 from . import Database
+from . import Prefetch
+from . import Catalog
+from . import H5Pool
+from . import Precision
+from . import ObjectCache
 
 from . import metadb
 
@@ -34,3 +42,10 @@ except ImportError:
     # Try backported to PY<37 `importlib_resources`.
     import importlib_resources as pkg_resources
 
+
+def __getattr__(name):
+    # Loaded on first use, see PosteriorDatabase.__getattr__
+    if name == 'PSD':
+        from .PSDClasses import PSD
+        return PSD
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
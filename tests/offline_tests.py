@@ -0,0 +1,972 @@
+import pytest
+import numpy as np
+import pandas as pd
+import h5py
+import os
+import json
+import hashlib
+import sys
+import zipfile
+import threading
+import subprocess
+import types
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from ringdb import Database, Prefetcher
+from ringdb.File import File, download
+from ringdb.H5Pool import H5FilePool
+from ringdb.StrainDatabase import StrainDatabase
+from ringdb.WorkQueue import WorkQueue
+from ringdb.DataFrameClasses import TimeSeries
+
+def create_db(folder, **url_tables):
+	db = Database(str(folder), **url_tables)
+	db.initialize()
+	return db
+
+def write_strain_file(path, detectors=("H1", "L1"), t0=1126259446.0, fs=1024, duration=32):
+	n = int(fs*duration)
+	with h5py.File(path, "w") as f:
+		for ifo in detectors:
+			dset = f.create_dataset(f"{ifo}/strain/Strain", data=np.sin(np.arange(n)/fs))
+			dset.attrs["Xstart"] = t0
+			dset.attrs["Xspacing"] = 1.0/fs
+			dset.attrs["Npoints"] = n
+			f[f"{ifo}/meta/Duration"] = duration
+
+def write_posterior_file(path, approximant="C01:IMRPhenomXPHM", n=1000, detectors=("H1", "L1"), seed=0):
+	rng = np.random.default_rng(seed)
+	names = ["mass_1", "mass_2", "final_mass_non_evolved", "final_spin", "ra", "dec", "geocent_time", "psi"]
+	samples = np.zeros(n, dtype=[(name, "f8") for name in names])
+	for name in names:
+		samples[name] = rng.uniform(0.1, 1.0, n)
+	samples["geocent_time"] += 1126259462.0
+	with h5py.File(path, "w") as f:
+		f[f"{approximant}/posterior_samples"] = samples
+		f["C01:SEOBNRv4PHM/posterior_samples"] = samples[:10]
+		f["version"] = "1"
+		for ifo in detectors:
+			freq = np.arange(20.0, 512.0, 0.25)
+			f[f"{approximant}/psds/{ifo}"] = np.stack([freq, 1e-46*np.ones_like(freq)], axis=1)
+		f[f"{approximant}/meta_data/meta_data/f_ref"] = 20.0
+		f[f"{approximant}/meta_data/meta_data/f_low"] = 20.0
+	return samples
+
+def posterior_urls_sharing(events, url, filename):
+	df = Database(None).posterior_urls
+	df.loc[df.event.isin(events), ['url', 'filename']] = [url, filename]
+	return df
+
+
+class TestPrefetch:
+
+	def test_shared_archive_is_planned_once(self, tmp_path):
+		df = posterior_urls_sharing(["GW151012", "GW151226"], "https://example.org/files/GWTC1.zip", "GWTC1.zip")
+		db = create_db(tmp_path / "Data", posterior_urls=df)
+
+		jobs = Prefetcher(db).plan(["GW151012", "GW151226"], products=["posteriors"])
+		assert len(jobs) == 1
+		assert jobs[0].events == ["GW151012", "GW151226"]
+
+	def test_psd_outside_gwtc1_uses_posterior_download(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		jobs = Prefetcher(db).plan(["GW190521_074359"], products=["psd", "posteriors"])
+		assert len(jobs) == 1
+		assert jobs[0].key[0] == 'posteriors'
+
+	def test_unknown_product(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		with pytest.raises(ValueError):
+			Prefetcher(db).plan(["GW150914"], products=["waveforms"])
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+	"""Serves a fixed payload with Range support, dropping the first response halfway"""
+	payload = bytes(range(256)) * 4096
+	drops = 0
+	requests = []
+
+	def do_GET(self):
+		type(self).requests.append(self.headers.get("Range"))
+		start = 0
+		if self.headers.get("Range"):
+			start = int(self.headers["Range"].split("=")[1].split("-")[0])
+			self.send_response(206)
+			self.send_header("Content-Range", f"bytes {start}-{len(self.payload)-1}/{len(self.payload)}")
+		else:
+			self.send_response(200)
+		body = self.payload[start:]
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		if type(self).drops > 0:
+			type(self).drops -= 1
+			self.wfile.write(body[:len(body)//2])
+			self.wfile.flush()
+			self.connection.close()
+			return
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+@pytest.fixture
+def server():
+	RangeHandler.drops = 0
+	RangeHandler.requests = []
+	httpd = HTTPServer(("127.0.0.1", 0), RangeHandler)
+	thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+	thread.start()
+	yield f"http://127.0.0.1:{httpd.server_address[1]}/files/strain.hdf5?download=1"
+	httpd.shutdown()
+
+
+class TestDownload:
+
+	def test_download_from_url(self, server, tmp_path):
+		thefile = File.from_url(server, str(tmp_path), new_filename="GW150914-H1.hdf5")
+		assert thefile.path == f"{tmp_path}/GW150914-H1.hdf5"
+		assert open(thefile.path, "rb").read() == RangeHandler.payload
+		assert not (tmp_path / "GW150914-H1.hdf5.part").exists()
+
+	def test_resume_after_dropped_connection(self, server, tmp_path):
+		RangeHandler.drops = 1
+		path = download(server, str(tmp_path / "strain.hdf5"), backoff=0.0)
+		assert open(path, "rb").read() == RangeHandler.payload
+		assert RangeHandler.requests[0] is None
+		assert RangeHandler.requests[1] == f"bytes={len(RangeHandler.payload)//2}-"
+
+	def test_checksum(self, server, tmp_path):
+		digest = hashlib.md5(RangeHandler.payload).hexdigest()
+		download(server, str(tmp_path / "good.hdf5"), checksum=f"md5:{digest}")
+		with pytest.raises(ValueError):
+			download(server, str(tmp_path / "bad.hdf5"), checksum="md5:0000")
+		assert not (tmp_path / "bad.hdf5").exists()
+		assert not (tmp_path / "bad.hdf5.part").exists()
+
+
+class TestArchiveExtraction:
+
+	def create_archive_db(self, tmp_path):
+		df = posterior_urls_sharing(["GW150914", "GW151012"], "https://example.org/GWTC1.zip", "GWTC1.zip")
+		db = create_db(tmp_path / "Data", posterior_urls=df)
+		write_posterior_file(tmp_path / "GW150914.h5", n=5)
+		write_posterior_file(tmp_path / "GW151012.h5", n=7)
+		# (as if downloaded, with a second file for GW150914)
+		with zipfile.ZipFile(f"{db.posterior_folder}/GWTC1.zip", "w") as archive:
+			archive.write(tmp_path / "GW150914.h5", "pesummary_samples/GW150914_GWTC-1.h5")
+			archive.write(tmp_path / "GW151012.h5", "pesummary_samples/GW150914_GWTC-1_prior.h5")
+			archive.write(tmp_path / "GW151012.h5", "pesummary_samples/GW151012_GWTC-1.h5")
+		return db
+
+	def test_only_requested_member_is_extracted(self, tmp_path):
+		db = self.create_archive_db(tmp_path)
+		thefile = db.PosteriorDB.download_file("GW150914")
+
+		assert thefile.path == f"{db.posterior_folder}/GW150914.h5"
+		assert open(thefile.path, "rb").read() == open(tmp_path / "GW150914.h5", "rb").read()
+		# Other files of the event keep their names rather than overwrite it
+		assert open(f"{db.posterior_folder}/GW150914_GWTC-1_prior.h5", "rb").read() == open(tmp_path / "GW151012.h5", "rb").read()
+		assert db.PosteriorDB.manifest.get("GW150914", "posteriors")["path"] == thefile.path
+		assert not os.path.exists(f"{db.posterior_folder}/GW151012.h5")
+		assert db.PosteriorDB.extracted_members("GWTC1.zip") == ["pesummary_samples/GW150914_GWTC-1.h5",
+		                                                         "pesummary_samples/GW150914_GWTC-1_prior.h5"]
+		assert os.path.exists(f"{db.posterior_folder}/GWTC1.zip")
+
+		# The archive is dropped once its last event is out
+		db.PosteriorDB.download_file("GW151012")
+		assert db.PosteriorDB.manifest.contains("GW151012", "posteriors")
+		assert open(f"{db.posterior_folder}/GW151012.h5", "rb").read() == open(tmp_path / "GW151012.h5", "rb").read()
+		assert not os.path.exists(f"{db.posterior_folder}/GWTC1.zip")
+
+	def test_batched_extraction(self, tmp_path):
+		db = self.create_archive_db(tmp_path)
+		db.PosteriorDB.download_file("GW150914", events=["GW151012"])
+		assert os.path.exists(f"{db.posterior_folder}/GW151012.h5")
+		assert not os.path.exists(f"{db.posterior_folder}/GWTC1.zip")
+
+
+class TestCatalog:
+
+	def test_lookups_match_the_url_tables(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		strain, posterior = db.strain_urls, db.posterior_urls
+
+		row = strain.iloc[-1]
+		assert db.StrainDB.get_url(row.Event, row.Detector, row.Duration) == row.Url
+		assert db.StrainDB.available_detectors("GW170814") == ["H1", "L1", "V1"]
+		assert db.event_list() == list(strain.Event.unique())
+
+		for cosmo in [True, False]:
+			db.PosteriorDB.cosmo = cosmo
+			mask = (posterior.event == "GW190521_074359") & (posterior.cosmo == cosmo)
+			assert db.PosteriorDB.get_url("GW190521_074359") == posterior.loc[mask, 'url'].values[0]
+
+		assert db.PosteriorDB.in_catalog("GW200129_065458", "GWTC-3")
+		assert db.PosteriorDB.in_GWTC1("GW150914")
+		assert not db.PosteriorDB.in_GWTC1("GW190521")
+
+
+class TestStartup:
+
+	heavy_modules = ['lal', 'lalsimulation', 'matplotlib', 'scipy', 'ringdown', 'tqdm']
+	import_budget = 2.0 # seconds, importing everything eagerly takes several
+
+	def test_import_is_lazy_and_fast(self):
+		code = ("import time; start = time.perf_counter(); import ringdb, sys; "
+				"elapsed = time.perf_counter() - start; "
+				f"print(elapsed); print(','.join(m for m in {self.heavy_modules!r} if m in sys.modules))")
+		out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split("\n")
+		assert out[1] == ""
+		assert float(out[0]) < self.import_budget
+
+
+class TestManifest:
+
+	def test_prefix_events_are_not_confused(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW190521_074359.hdf5")
+		assert not db.StrainDB.event_present("GW190521")
+		assert db.StrainDB.event_present("GW190521_074359")
+		assert db.StrainDB.events_present == ["GW190521_074359"]
+
+	def test_existing_files_are_registered(self, tmp_path):
+		folder = tmp_path / "Data"
+		create_db(folder)
+		write_strain_file(f"{folder}/StrainData/GW150914.hdf5")
+		write_posterior_file(f"{folder}/PosteriorData/GW150914.h5")
+		for manifest in (folder / "StrainData" / ".manifest.sqlite", folder / "PosteriorData" / ".manifest.sqlite"):
+			if manifest.exists():
+				manifest.unlink()
+
+		db = create_db(folder)
+		entry = db.StrainDB.manifest.get("GW150914", "strain")
+		assert entry['detectors'] == ["H1", "L1"]
+		assert entry['duration'] == 32.0
+		assert db.PosteriorDB.events_present == ["GW150914"]
+		assert db.PosteriorDB.available_approximants("GW150914") == ["C01:IMRPhenomXPHM", "C01:SEOBNRv4PHM"]
+		assert db.PosteriorDB.choose_approximant("GW150914") == "C01:IMRPhenomXPHM"
+
+	def test_strain_duration_is_checked(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		assert db.StrainDB.event_present("GW150914", duration=32)
+		assert not db.StrainDB.event_present("GW150914", duration=4096)
+		assert db.StrainDB.event_present("GW150914")
+
+	def test_one_connection_per_process(self, tmp_path):
+		import pickle
+		db = create_db(tmp_path / "Data")
+		write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		manifest = db.PosteriorDB.manifest
+		assert db.PosteriorDB.event_exists("GW150914")
+		conn = manifest.connect()
+		assert manifest.contains("GW150914", "posteriors") and manifest.connect() is conn
+
+		# A forked child opens its own, as does an unpickled copy
+		read, write = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(read)
+			ok = manifest.connect() is not conn and manifest.contains("GW150914", "posteriors")
+			os.write(write, b"1" if ok else b"0")
+			os._exit(0)
+		os.close(write)
+		assert os.read(read, 1) == b"1"
+		os.waitpid(pid, 0)
+		copy = pickle.loads(pickle.dumps(manifest))
+		assert copy.contains("GW150914", "posteriors") and copy.connect() is not conn
+
+	def test_redownloaded_file_is_rechecked(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		path = f"{db.posterior_folder}/GW150914.h5"
+		write_posterior_file(path, approximant="C01:IMRPhenomPv2")
+		assert db.PosteriorDB.choose_approximant("GW150914") == "C01:IMRPhenomPv2"
+		os.remove(path)
+		write_posterior_file(path, approximant="C01:IMRPhenomXPHM", n=10)
+		assert db.PosteriorDB.event_exists("GW150914")
+		assert db.PosteriorDB.choose_approximant("GW150914") == "C01:IMRPhenomXPHM"
+
+
+class TestH5Pool:
+
+	def test_handles_are_reused(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		db.StrainDB.pool = pool = H5FilePool(max_open=2)
+		path = f"{db.strain_folder}/GW150914.hdf5"
+		write_strain_file(path)
+
+		strain = db.StrainDB.strain("GW150914")
+		assert set(strain) == {"H1", "L1"}
+		assert len(pool) == 1
+		assert pool.open(path) is pool.open(path)
+
+	def test_close_leaves_other_databases_open(self, tmp_path):
+		pool = H5FilePool()
+		dbs = [create_db(tmp_path / name) for name in ["One", "Two"]]
+		for db in dbs:
+			db.StrainDB.pool = db.PosteriorDB.pool = pool
+			write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+			db.StrainDB.strain("GW150914")
+		other = pool.open(f"{dbs[1].strain_folder}/GW150914.hdf5")
+		dbs[0].close()
+		assert f"{dbs[0].strain_folder}/GW150914.hdf5" not in pool
+		assert other.id.valid and len(pool) == 1
+
+	def test_lru_eviction_and_invalidation(self, tmp_path):
+		pool = H5FilePool(max_open=2)
+		paths = [str(tmp_path / f"{i}.hdf5") for i in range(3)]
+		for path in paths:
+			write_strain_file(path, detectors=("H1",))
+		handles = [pool.open(path) for path in paths]
+		assert paths[0] not in pool
+		assert not handles[0].id.valid
+
+		pool.invalidate(paths[2])
+		assert paths[2] not in pool
+		# A file replaced by a new download is picked up without an explicit invalidate
+		old = pool.open(paths[1])
+		write_strain_file(paths[1] + ".part", detectors=("L1",), duration=16)
+		os.replace(paths[1] + ".part", paths[1])
+		assert list(pool.open(paths[1]).keys()) == ["L1"]
+		assert not old.id.valid
+		pool.close()
+		assert len(pool) == 0
+
+	def test_borrowed_handles_stay_open(self, tmp_path):
+		pool = H5FilePool(max_open=1)
+		paths = [str(tmp_path / f"{i}.hdf5") for i in range(3)]
+		for path in paths:
+			write_strain_file(path, detectors=("H1",))
+		with pool.borrow(paths[0]) as f:
+			# Neither eviction nor invalidation closes a handle in use
+			pool.open(paths[1])
+			pool.invalidate(paths[0])
+			assert f.id.valid
+			assert f["H1/strain/Strain"].shape == (32*1024,)
+			assert paths[0] not in pool
+		assert not f.id.valid
+
+		# Readers on several threads never see a handle closed under them
+		errors = []
+		def read(path):
+			try:
+				for _ in range(50):
+					with pool.borrow(path) as f:
+						f["H1/strain/Strain"][:10]
+			except Exception as e:
+				errors.append(e)
+		threads = [threading.Thread(target=read, args=(path,)) for path in paths*2]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		assert errors == []
+		assert len(pool) == 1
+
+
+class TestSchema:
+
+	def test_read_schema_in_one_pass(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		event = db.event("GW150914")
+
+		result = event.read_schema(["sample", "t0", "dt", "Npoints", "psd"], detectors=["H1", "L1"])
+		assert set(result) == {"sample", "t0", "dt", "Npoints", "psd"}
+		assert set(result["sample"]) == {"H1", "L1"}
+		assert result["Npoints"]["L1"] == 32*1024
+		assert result["psd"]["H1"].shape[1] == 2
+		assert result["t0"] == event.read_strain_file_from_schema("t0", detectors=["H1", "L1"])
+
+		single = event.read_schema(["t0", "dt"], detectors="H1")
+		assert single == {"t0": 1126259446.0, "dt": 1/1024}
+
+		with pytest.raises(KeyError):
+			event.read_schema(["not_a_field"])
+
+
+class TestPosteriors:
+
+	def test_column_projection(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		event = db.event("GW150914")
+
+		full = event.posteriors()
+		some = event.posteriors(columns=["final_mass", "ra", "geocent_time"])
+		assert list(some.columns) == ["final_mass", "ra", "geocent_time", "waveform_name", "waveform_code"]
+		assert np.array_equal(some["final_mass"], samples["final_mass_non_evolved"])
+		assert np.array_equal(some["ra"], full["ra"])
+
+		with pytest.raises(KeyError):
+			event.posteriors(columns=["chirp_mass"])
+
+	def test_column_projection_dat(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		path = f"{db.posterior_folder}/GW150914.dat"
+		pd.DataFrame({"final_mass_non_evolved": [60.0, 61.0], "final_spin": [0.7, 0.6], "ra": [1.0, 2.0]}).to_csv(path, sep="\t", index=False)
+		db.PosteriorDB.event_path = lambda event: path
+		df = db.PosteriorDB.posteriors("GW150914", columns=["final_mass"])
+		assert list(df["final_mass"]) == [60.0, 61.0]
+		assert "ra" not in df
+
+	def test_iter_posteriors(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		event = db.event("GW150914")
+
+		chunks = list(event.iter_posteriors(chunk_size=300))
+		assert [len(chunk) for chunk in chunks] == [300, 300, 300, 100]
+		assert chunks[1].index[0] == 300
+		pd.testing.assert_frame_equal(pd.concat(chunks), event.posteriors())
+
+		# Other files opened mid-iteration don't close the file being iterated
+		db.PosteriorDB.pool = H5FilePool(max_open=1)
+		iterator = event.iter_posteriors(chunk_size=300)
+		first = next(iterator)
+		for i in range(3):
+			write_strain_file(str(tmp_path / f"{i}.hdf5"))
+			db.PosteriorDB.pool.open(str(tmp_path / f"{i}.hdf5"))
+		assert sum(len(chunk) for chunk in iterator) + len(first) == 1000
+
+		arrays = list(event.iter_posteriors(chunk_size=400, columns=["final_mass", "ra"], structured=True))
+		assert arrays[0].dtype.names == ("final_mass", "ra")
+		assert np.array_equal(np.concatenate(arrays)["final_mass"], samples["final_mass_non_evolved"])
+
+		path = f"{db.posterior_folder}/GW150914.dat"
+		pd.DataFrame({"final_mass_non_evolved": np.arange(5.0), "ra": np.ones(5)}).to_csv(path, sep="\t", index=False)
+		db.PosteriorDB.event_path = lambda event: path
+		chunks = list(event.iter_posteriors(chunk_size=2, columns=["final_mass"]))
+		assert [list(chunk["final_mass"]) for chunk in chunks] == [[0.0, 1.0], [2.0, 3.0], [4.0]]
+		assert chunks[2].index[0] == 4 and chunks[2]["waveform_name"].iloc[0] == "IMRPhenomPv2"
+
+	@pytest.mark.parametrize("workers", [1, 2])
+	def test_stacked_posteriors(self, tmp_path, workers):
+		db = create_db(tmp_path / "Data", dtype="compact")
+		first = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=100)
+		second = write_posterior_file(f"{db.posterior_folder}/GW151012.h5", n=50, seed=1)
+		with h5py.File(f"{db.posterior_folder}/GW151012.h5", "a") as f:
+			# GW151012 has an extra column, and no psi
+			samples = f["C01:IMRPhenomXPHM/posterior_samples"][:]
+			names = [name for name in samples.dtype.names if name != "psi"]
+			extra = np.zeros(len(samples), dtype=[(name, "f8") for name in names + ["chi_eff"]])
+			for name in names:
+				extra[name] = samples[name]
+			del f["C01:IMRPhenomXPHM/posterior_samples"]
+			f["C01:IMRPhenomXPHM/posterior_samples"] = extra
+
+		df = db.posteriors(["GW150914", "GW151012", "GW000000"], workers=workers)
+		assert len(df) == 150
+		assert list(df["event"].cat.categories) == ["GW150914", "GW151012"]
+		assert (df["event"] == "GW151012").sum() == 50
+		assert np.array_equal(df["geocent_time"].values[100:], second["geocent_time"])
+		assert df["mass_1"].dtype == np.float32
+		assert np.isnan(df["chi_eff"].values[:100]).all() and np.isnan(df["psi"].values[100:]).all()
+		assert isinstance(df["waveform_name"].dtype, pd.CategoricalDtype)
+
+		arrays = db.posteriors(["GW150914"], columns=["ra"], as_arrays=True)
+		assert set(arrays) == {"ra", "waveform_name", "waveform_code", "event"}
+		assert np.allclose(arrays["ra"], first["ra"])
+
+	def test_column_cache(self, tmp_path):
+		db = create_db(tmp_path / "Data", column_cache=True)
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		event = db.event("GW150914")
+		first = event.posteriors()
+
+		cache = db.PosteriorDB.cache_path("GW150914")
+		assert cache.endswith("GW150914/C01_IMRPhenomXPHM-cosmo")
+		assert os.path.exists(f"{cache}/meta.json")
+
+		# Later loads never open the posterior file
+		db.PosteriorDB.read_source = None
+		cached = event.posteriors()
+		pd.testing.assert_frame_equal(cached, first)
+		some = event.posteriors(columns=["final_mass", "ra"])
+		assert list(some.columns) == ["final_mass", "ra", "waveform_name", "waveform_code"]
+		assert np.array_equal(some["final_mass"], samples["final_mass_non_evolved"])
+		with pytest.raises(KeyError):
+			event.posteriors(columns=["chirp_mass"])
+		del db.PosteriorDB.read_source
+
+		# A changed posterior file invalidates the cache
+		db.PosteriorDB.pool.invalidate(f"{db.posterior_folder}/GW150914.h5")
+		new_samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=50, seed=1)
+		os.utime(f"{db.posterior_folder}/GW150914.h5", (0, 1))
+		assert db.PosteriorDB.read_cache("GW150914") is None
+		assert np.array_equal(event.posteriors()["mass_1"], new_samples["mass_1"])
+
+	def test_column_cache_off_by_default(self, tmp_path, monkeypatch):
+		db = create_db(tmp_path / "Data")
+		write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		read = []
+		original = db.PosteriorDB.read_fields
+		monkeypatch.setattr(db.PosteriorDB, "read_fields", lambda dataset, fields, **kw: read.append(fields) or original(dataset, fields, **kw))
+
+		db.event("GW150914").posteriors(columns=["ra", "dec"])
+		assert read == [["ra", "dec"]]
+		assert not os.path.exists(f"{db.posterior_folder}/PosteriorCache")
+
+	def test_column_cache_serves_projected_miss(self, tmp_path, monkeypatch):
+		db = create_db(tmp_path / "Data", column_cache=True)
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		some = db.event("GW150914").posteriors(columns=["ra"])
+		assert list(some.columns) == ["ra", "waveform_name", "waveform_code"]
+		assert np.array_equal(some["ra"], samples["ra"])
+		assert db.PosteriorDB.read_cache("GW150914") is not None
+
+	def test_compact_dtypes(self, tmp_path):
+		db = create_db(tmp_path / "Data", dtype="compact")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		event = db.event("GW150914")
+
+		df = event.posteriors()
+		assert df["mass_1"].dtype == np.float32 and df["final_mass"].dtype == np.float32
+		assert df["geocent_time"].dtype == np.float64
+		assert np.array_equal(df["geocent_time"], samples["geocent_time"])
+		assert np.allclose(df["mass_1"], samples["mass_1"], rtol=1e-7, atol=0)
+		assert isinstance(df["waveform_name"].dtype, pd.CategoricalDtype)
+		assert list(df["waveform_code"].cat.categories) == [int(df["waveform_code"].iloc[0])]
+
+		strain = event.strain(detectors="H1")
+		assert strain.dtype == np.float32
+		assert strain.index[0] == 1126259446.0
+		assert np.allclose(strain.values, np.sin(np.arange(32*1024)/1024), atol=1e-7)
+
+		with pytest.raises(ValueError):
+			create_db(tmp_path / "Other", dtype="float16")
+
+
+def fake_peak_time(sample, wf=None, dt=None, f_low=None, f_ref=None, precision=None):
+	if sample["mass_1"] < 0.2:
+		raise ValueError("no waveform")
+	t_peak = sample["geocent_time"] + sample["mass_1"]
+	return t_peak, {"geocent": t_peak, "H1": t_peak + 0.01, "L1": t_peak - 0.01}, None, None
+
+
+class TestPeakTimes:
+
+	@pytest.mark.parametrize("workers", [1, 2])
+	def test_calculate_t_peaks(self, tmp_path, monkeypatch, workers):
+		# (the module, the package attribute of the same name is the class)
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", fake_peak_time)
+		db = create_db(tmp_path / "Data")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=300)
+
+		peaks = db.PosteriorDB.calculate_t_peaks("GW150914", workers=workers, chunk_size=64)
+		assert list(peaks.index) == list(range(300))
+		failed = samples["mass_1"] < 0.2
+		assert np.isnan(peaks["t_peak"].values[failed]).all()
+		assert (peaks["error"][failed] == "ValueError('no waveform')").all()
+		assert np.allclose(peaks["t_peak"].values[~failed], (samples["geocent_time"] + samples["mass_1"])[~failed])
+		assert np.allclose((peaks["H1_peak"] - peaks["t_peak"])[~failed], 0.01)
+
+		df = db.event("GW150914").posteriors(peaks=True)
+		assert list(df.columns[:4]) == ["t_peak", "H1_peak", "L1_peak", "error"]
+		assert np.array_equal(df["t_peak"], peaks["t_peak"], equal_nan=True)
+		assert np.isnan(df["t_peak"][failed]).all()
+
+	def test_peak_times_validated_by_hash(self, tmp_path, monkeypatch):
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", fake_peak_time)
+		db = create_db(tmp_path / "Data")
+		write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=100)
+		event = db.event("GW150914")
+		first = event.posteriors(peaks=True)
+		assert os.path.exists(f"{db.posterior_folder}/PeakTimes/GW150914.npz")
+
+		# Joining saved peak times reads the posterior file once, for the
+		# table itself, and doesn't recalculate anything
+		reads = []
+		original = db.PosteriorDB.read_source
+		monkeypatch.setattr(db.PosteriorDB, "read_source", lambda *args, **kw: reads.append(args) or original(*args, **kw))
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "peak_times_chunk", None)
+		pd.testing.assert_frame_equal(event.posteriors(peaks=True), first)
+		assert len(reads) == 1
+		some = event.posteriors(columns=["ra"], peaks=True)
+		assert len(reads) == 2
+		assert list(some.columns) == ["t_peak", "H1_peak", "L1_peak", "error", "ra", "waveform_name", "waveform_code"]
+		assert np.array_equal(some["t_peak"], first["t_peak"], equal_nan=True)
+		monkeypatch.undo()
+
+		# New posterior samples make the saved peak times stale
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", fake_peak_time)
+		db.PosteriorDB.pool.invalidate(f"{db.posterior_folder}/GW150914.h5")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=100, seed=1)
+		os.utime(f"{db.posterior_folder}/GW150914.h5", (0, 1))
+		df = event.posteriors(peaks=True)
+		valid = samples["mass_1"] >= 0.2
+		assert np.allclose(df["t_peak"][valid], (samples["geocent_time"] + samples["mass_1"])[valid])
+
+	def test_adaptive_peak_time(self):
+		import lalsimulation as ls
+		from ringdb.peak import complex_strain_peak_time_td, parabolic_peak, adaptive_step
+		sample = {"mass_1": 80.0, "mass_2": 60.0, "spin_1z": 0.3, "final_spin": 0.7,
+		          "iota": 0.5, "luminosity_distance": 500.0, "geocent_time": 1126259462.0}
+		t, h = complex_strain_peak_time_td(sample, wf=ls.IMRPhenomPv2, dt=1/65536, precision=None)[2:]
+		reference = parabolic_peak(t, h)
+
+		fixed, _, t_fixed, _ = complex_strain_peak_time_td(sample, wf=ls.IMRPhenomPv2, dt=1/4096)
+		adaptive, t_dict, t_adaptive, _ = complex_strain_peak_time_td(sample, wf=ls.IMRPhenomPv2, dt=1/4096, precision=1e-4)
+		assert t_dict == {"geocent": adaptive}
+		assert fixed in t_fixed
+		assert len(t_adaptive) < len(t_fixed)/2
+		assert abs(adaptive - reference) < 1e-4
+		assert adaptive_step(dict(sample, mass_1=8.0, mass_2=6.0), 1e-4, dt_min=1/4096) == 1/4096
+		# A precision finer than dt is met by the refinement
+		fine = complex_strain_peak_time_td(sample, wf=ls.IMRPhenomPv2, dt=1/4096, precision=1e-6)[0]
+		assert abs(fine - reference) < 1e-5
+
+	def test_refined_peak_picks_the_loudest_maximum(self):
+		from ringdb.peak import refined_peak, parabolic_peak
+		# Two near-equal maxima, the quieter one right on a coarse sample
+		# and the louder one halfway between two
+		signal = lambda t: np.exp(-((t - 0.1005)/0.004)**2) + 0.997*np.exp(-((t - 0.08)/0.004)**2)
+		t = np.arange(0, 0.2, 1e-3)
+		h = signal(t)*np.exp(2j*np.pi*50*t)
+		assert abs(parabolic_peak(t, h) - 0.08) < 2e-4
+		assert abs(refined_peak(t, h, 1e-5) - 0.1005) < 1e-5
+
+	def test_detector_peak_times(self):
+		import lal
+		from ringdb.peak import detector_peak_times
+		rng = np.random.default_rng(0)
+		t_peak = 1126259462.4 + rng.uniform(0, 1e6, 500)
+		t_peak[::50] = np.nan
+		ra, dec = rng.uniform(0, 2*np.pi, 500), np.arcsin(rng.uniform(-1, 1, 500))
+		for ifo in ["H1", "L1", "V1"]:
+			location = lal.cached_detector_by_prefix[ifo].location
+			expected = [t + lal.TimeDelayFromEarthCenter(location, r, d, t) if np.isfinite(t) else np.nan
+			            for t, r, d in zip(t_peak, ra, dec)]
+			assert np.allclose(detector_peak_times(t_peak, ra, dec, ifo), expected, rtol=0, atol=1e-9, equal_nan=True)
+
+	def test_subsampled_peak_median(self, tmp_path, monkeypatch):
+		calls = []
+		def counting_peak_time(sample, **kwargs):
+			calls.append(sample["geocent_time"])
+			return fake_peak_time(sample, **kwargs)
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", counting_peak_time)
+		db = create_db(tmp_path / "Data")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=1001)
+		t_peak = samples["geocent_time"] + samples["mass_1"]
+		event = db.event("GW150914")
+
+		quick = event.peak_median_sample(max_samples=201, seed=3)
+		assert len(calls) == 201
+		assert quick["n_peak_samples"][0] == np.sum(samples["mass_1"][np.isin(samples["geocent_time"], calls)] >= 0.2)
+		assert 0 < quick["t_peak_error"][0] < 0.1
+		assert abs(quick["t_peak"][0] - np.median(t_peak[samples["mass_1"] >= 0.2])) < 3*quick["t_peak_error"][0]
+		pd.testing.assert_frame_equal(event.peak_median_sample(max_samples=201, seed=3), quick)
+		assert len(calls) == 201
+
+		# Every sample, the lower middle one as the sorted median always gave
+		full = event.t_peak_median_sample
+		valid = np.sort(t_peak[samples["mass_1"] >= 0.2])
+		assert full["t_peak"][0] == valid[(len(valid) - 1)//2]
+		assert full["event"][0] == "GW150914"
+		assert "t_peak_error" not in full and "n_peak_samples" not in full
+
+		# No peak times at all leaves just the event
+		write_posterior_file(f"{db.posterior_folder}/GW151012.h5", n=10)
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", lambda *args, **kwargs: 1/0)
+		assert list(db.event("GW151012").t_peak_median_sample.columns) == ["event"]
+
+	@pytest.mark.parametrize("workers", [1, 2])
+	def test_compute_peak_times(self, tmp_path, monkeypatch, workers):
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", fake_peak_time)
+		db = create_db(tmp_path / "Data")
+		write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=100)
+		write_posterior_file(f"{db.posterior_folder}/GW151012.h5", n=50, seed=1)
+		# (a broken file that arrives after the folder was first scanned)
+		db.PosteriorDB.manifest
+		with open(f"{db.posterior_folder}/GW151226.h5", "wb") as f:
+			f.write(b"not an hdf5 file")
+		events = ["GW150914", "GW151012", "GW151226"]
+
+		status = db.compute_peak_times(events, workers=workers, max_failures=2).set_index("event")
+		assert list(status.status) == ["done", "done", "failed"]
+		assert list(status.attempts) == [1, 1, 2]
+		assert list(status.failures) == [0, 0, 2]
+		assert (status.seconds >= 0).all()
+		assert status.error["GW151226"] is not None
+		for event in events[:2]:
+			assert os.path.exists(f"{db.posterior_folder}/PeakTimes/{event}.npz")
+
+		# Finished events are not worked on again, even by a new process
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "peak_times_chunk", None)
+		again = db.compute_peak_times(events[:2]).set_index("event")
+		pd.testing.assert_frame_equal(again, status.loc[events[:2]])
+		# (working in this process leaves the worker processes' Database unset)
+		assert sys.modules["ringdb.Database"]._posterior_worker_db is None
+		monkeypatch.undo()
+
+		# A changed posterior file queues its event again
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "complex_strain_peak_time_td", fake_peak_time)
+		db.PosteriorDB.pool.invalidate(f"{db.posterior_folder}/GW151012.h5")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW151012.h5", n=50, seed=2)
+		os.utime(f"{db.posterior_folder}/GW151012.h5", (0, 1))
+		again = db.compute_peak_times(events[:2]).set_index("event")
+		assert list(again.status) == ["done", "done"] and list(again.attempts) == [1, 2]
+		peaks = db.PosteriorDB.calculate_t_peaks("GW151012")
+		valid = samples["mass_1"] >= 0.2
+		assert np.allclose(peaks["t_peak"][valid], (samples["geocent_time"] + samples["mass_1"])[valid])
+		# as does registering a new file for it
+		db.PosteriorDB.register_file("GW150914", f"{db.posterior_folder}/GW150914.h5")
+		queue = WorkQueue(f"{db.posterior_folder}/PeakTimes")
+		assert list(queue.status(events[:2]).status) == ["pending", "done"]
+
+	def test_work_queue_claims_each_event_once(self, tmp_path):
+		queue = WorkQueue(str(tmp_path))
+		queue.add(["A", "B"])
+		assert queue.claim(["A", "B"], worker="one") == "A"
+		assert queue.claim(["A", "B"], worker="two") == "B"
+		assert queue.claim(["A", "B"], worker="three") is None
+		# An event left running by a worker that died is handed out again
+		assert queue.claim(["A", "B"], worker="four", stale_after=-1) == "A"
+		queue.release("A")
+		assert queue.status().set_index("event").loc["A", "status"] == "pending"
+
+	def test_legacy_csv_peak_times(self, tmp_path, monkeypatch):
+		db = create_db(tmp_path / "Data")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=10)
+		os.makedirs(f"{db.posterior_folder}/PeakTimes")
+		pd.DataFrame({"sample_index": range(10), "t_peak": samples["geocent_time"], "H1_peak": samples["geocent_time"],
+		              "L1_peak": samples["geocent_time"], "final_mass_check": samples["final_mass_non_evolved"],
+		              "final_spin_check": samples["final_spin"]}).to_csv(f"{db.posterior_folder}/PeakTimes/GW150914.csv", index=False)
+		monkeypatch.setattr(sys.modules["ringdb.PosteriorDatabase"], "peak_times_chunk", None)
+		peaks = db.PosteriorDB.calculate_t_peaks("GW150914")
+		assert np.allclose(peaks["t_peak"], samples["geocent_time"])
+		assert os.path.exists(f"{db.posterior_folder}/PeakTimes/GW150914.npz")
+
+	def test_resume_and_extend(self, tmp_path, monkeypatch):
+		module = sys.modules["ringdb.PosteriorDatabase"]
+		db = create_db(tmp_path / "Data")
+		samples = write_posterior_file(f"{db.posterior_folder}/GW150914.h5", n=300)
+		calls = []
+		def counting_peak_time(sample, **kwargs):
+			calls.append(sample["geocent_time"])
+			if len(calls) == 180:
+				raise KeyboardInterrupt
+			return fake_peak_time(sample, **kwargs)
+		monkeypatch.setattr(module, "complex_strain_peak_time_td", counting_peak_time)
+
+		# Only the first samples, then interrupted part way through the rest
+		first = db.PosteriorDB.calculate_t_peaks("GW150914", chunk_size=64, samples=100)
+		assert list(first.index) == list(range(100)) and len(calls) == 100
+		with pytest.raises(KeyboardInterrupt):
+			db.PosteriorDB.calculate_t_peaks("GW150914", chunk_size=64)
+		assert sorted(os.listdir(db.PosteriorDB.checkpoint_folder("GW150914"))) == ["100-163.npz"]
+
+		# Resuming only calculates what wasn't saved
+		peaks = db.PosteriorDB.calculate_t_peaks("GW150914", chunk_size=64)
+		assert len(calls) == 180 + (300 - 164)
+		assert list(peaks.index) == list(range(300))
+		assert not os.path.exists(db.PosteriorDB.checkpoint_folder("GW150914"))
+		assert np.allclose(peaks["t_peak"].dropna(), (samples["geocent_time"] + samples["mass_1"])[samples["mass_1"] >= 0.2])
+
+		# New detectors come from the sky position, without new waveforms
+		peaks = db.PosteriorDB.calculate_t_peaks("GW150914", detectors=["H1", "L1", "V1"])
+		assert len(calls) == 316
+		import lal
+		i = int(np.argmax(samples["mass_1"]))
+		delay = lal.TimeDelayFromEarthCenter(lal.cached_detector_by_prefix["V1"].location, samples["ra"][i], samples["dec"][i], peaks["t_peak"][i])
+		assert np.isclose(peaks["V1_peak"][i], peaks["t_peak"][i] + delay, rtol=0, atol=1e-9)
+
+
+class TestObjectCache:
+
+	def test_products_are_cached(self, tmp_path):
+		db = create_db(tmp_path / "Data", cache_bytes=10**7)
+		write_posterior_file(f"{db.posterior_folder}/GW150914.h5")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		event = db.event("GW150914")
+
+		first = event.strain()
+		db.StrainDB.strain = None
+		second = db.event("GW150914").strain()
+		assert np.shares_memory(first["H1"].values, second["H1"].values)
+		assert second["H1"].ifo == "H1" and second["H1"].name == "H1"
+		assert db.cache_info()["hits"] == 1 and db.cache_info()["misses"] == 1
+		assert db.cache_info()["bytes"] == 2*2*32*1024*8
+
+		# Shared arrays are read-only, but callers can still add columns
+		df = event.posteriors(columns=["ra", "dec"])
+		with pytest.raises(ValueError):
+			df.loc[0, "ra"] = 0.0
+		with pytest.raises(ValueError):
+			df["dec"].values[0] = 0.0
+		df["extra"] = 1.0
+		assert "extra" not in event.posteriors(columns=["ra", "dec"])
+		assert db.cache_info()["hits"] == 2
+
+		# Loading past the budget evicts the least recently used product
+		db.cache.max_bytes = db.cache.bytes + 1
+		event.posteriors()
+		info = db.cache_info()
+		assert info["evictions"] == 1 and info["items"] == 2 and info["bytes"] <= info["max_bytes"]
+		assert [key[1] for key in db.cache._items] == ["posteriors", "posteriors"]
+
+	def test_memory_maps_take_no_budget(self, tmp_path):
+		db = create_db(tmp_path / "Data", cache_bytes=10**7)
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		event = db.event("GW150914")
+		strain = event.strain(mmap=True)
+		assert db.StrainDB.memory_map("GW150914", "H1") is not None
+		# (only the time stamps of the index are held in memory)
+		assert db.cache_info()["bytes"] == 2*32*1024*8
+		with pytest.raises(ValueError):
+			strain["H1"].iloc[0] = 1.0
+
+	def test_no_cache_by_default(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		strain = db.event("GW150914").strain(detectors="H1")
+		strain.iloc[0] = 1.0
+		assert db.cache_info() is None
+
+
+class TestStrain:
+
+	def test_windowed_read(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		event = db.event("GW150914")
+		full = event.strain()
+
+		window = event.strain(t_start=1126259462.0, t_end=1126259462.5)
+		assert len(window["H1"]) == 512
+		assert window["H1"].index[0] == 1126259462.0
+		assert np.array_equal(window["L1"].values, full["L1"].loc[1126259462.0:1126259462.5].values[:512])
+
+		around = event.strain(detectors="H1", around=1126259462.0, width=0.5)
+		assert np.allclose(around.index[[0, -1]], [1126259461.75, 1126259462.25 - 1/1024])
+
+		# Windows running off the end of the data are clipped
+		assert len(event.strain(detectors="H1", t_start=1126259470.0, t_end=1126259500.0)) == 8*1024
+
+	def test_memory_mapped_read(self, tmp_path):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		event = db.event("GW150914")
+		full = event.strain()
+
+		mapped = event.strain(mmap=True)
+		assert isinstance(mapped["H1"].values.base, np.memmap) or isinstance(mapped["H1"].values, np.memmap)
+		assert np.array_equal(mapped["H1"].values, full["H1"].values)
+		assert np.array_equal(mapped["H1"].index, full["H1"].index)
+
+		window = event.strain(detectors="L1", t_start=1126259462.0, t_end=1126259462.5, mmap=True)
+		assert window.index[0] == 1126259462.0
+		assert np.array_equal(window.values, full["L1"].loc[1126259462.0:].values[:512])
+
+	def test_compact_time_index(self, tmp_path, monkeypatch):
+		db = create_db(tmp_path / "Data")
+		write_strain_file(f"{db.strain_folder}/GW150914.hdf5")
+		event = db.event("GW150914")
+		full = event.strain(detectors="H1")
+		compact = event.strain(detectors="H1", compact=True)
+
+		assert isinstance(compact.index, pd.RangeIndex)
+		assert compact.delta_t == full.delta_t and compact.duration == full.duration
+		assert np.array_equal(compact.time, full.index)
+		assert np.array_equal(compact.materialize().index, full.index)
+
+		window = compact.crop(1126259462.0, 1126259462.5)
+		assert window.is_compact and len(window) == 512 and window.time[0] == 1126259462.0
+		assert np.array_equal(window.values, full.crop(1126259462.0, 1126259462.5).values)
+
+		kws = dict(flow=20, ds=4, t0=1126259462.0)
+		conditioned, reference = compact.condition(**kws), full.condition(**kws)
+		assert conditioned.is_compact and conditioned.ifo == "H1"
+		assert np.allclose(conditioned.values, reference.values)
+		assert np.allclose(conditioned.time, reference.index, rtol=0, atol=1e-9)
+
+		# (interpolated on the sample grid, without building the time stamps)
+		monkeypatch.setattr(TimeSeries, "materialize", None)
+		interpolated = compact.interpolate_to_index(fsamp=512)
+		assert interpolated.is_compact and interpolated.time[0] == full.index[0]
+		assert np.allclose(interpolated.values, full.interpolate_to_index(fsamp=512).values)
+		times = full.index[16*1024 + 100:16*1024 + 200] + 1e-4
+		at_times = window.interpolate_to_index(times)
+		assert not at_times.is_compact and np.array_equal(at_times.index, times)
+		assert np.allclose(at_times.values, full.interpolate_to_index(times).values)
+		monkeypatch.undo()
+
+		acf = reference.get_acf().iloc[:256]
+		whitened = acf.whiten(conditioned.iloc[:256])
+		assert whitened.is_compact
+		assert np.allclose(whitened.values, acf.whiten(reference.iloc[:256]).values)
+
+	def test_memory_map_falls_back_for_compressed_files(self, tmp_path, monkeypatch):
+		# (small slabs, so copies and fallback reads take several)
+		monkeypatch.setattr(StrainDatabase, "slab_size", 5000)
+		db = create_db(tmp_path / "Data")
+		# Detector files as served by GWOSC, one compressed and one not
+		for ifo, compression in [("H1", None), ("L1", "gzip")]:
+			with h5py.File(tmp_path / f"{ifo}.hdf5", "w") as f:
+				dset = f.create_dataset("strain/Strain", data=np.sin(np.arange(32*1024)/1024), compression=compression)
+				dset.attrs["Xstart"] = 1126259446.0
+				dset.attrs["Xspacing"] = 1/1024
+				f["meta/Duration"] = 32
+		files = {ifo: types.SimpleNamespace(path=tmp_path / f"{ifo}.hdf5") for ifo in ["H1", "L1"]}
+		db.StrainDB.combine_detector_files("GW150914", files)
+
+		assert db.StrainDB.memory_map("GW150914", "L1") is None
+		strain = db.event("GW150914").strain(mmap=True)
+		assert np.array_equal(strain["H1"].values, strain["L1"].values)
+
+		# Re-combining contiguously makes every detector mappable
+		db.StrainDB.combine_detector_files("GW150914", files, contiguous=True)
+		assert db.StrainDB.memory_map("GW150914", "L1") is not None
+		assert np.array_equal(db.StrainDB.memory_map("GW150914", "L1"), strain["L1"].values)
+		with h5py.File(f"{db.strain_folder}/GW150914.hdf5", "r") as f:
+			assert f["L1/meta/Duration"][()] == 32
+			assert f["L1/strain/Strain"].attrs["Xstart"] == 1126259446.0
+
+
+class TestPSDPadding:
+
+	def make_psd(self, f_low=20.0, f_high=511.0, df=0.25, ifo="H1"):
+		from ringdb.PSDClasses import PSD
+		freq = np.arange(f_low, f_high, df)
+		return PSD(1e-46*(1 + freq/100), index=freq, ifo=ifo)
+
+	def test_low_and_high_pad(self):
+		psd = self.make_psd()
+		low = psd.low_pad(from_freq=30.0)
+		assert low.index[0] == 0.0
+		assert np.allclose(np.diff(low.index), 0.25)
+		assert (low[low.index < 30.0] == psd[30.0]).all()
+		assert np.array_equal(low[30.0:].values, psd[30.0:].values)
+		assert low.ifo == "H1"
+
+		high = psd.high_pad(to_freq=1024)
+		assert high.index[-1] == 1024.0
+		assert np.allclose(np.diff(high.index), 0.25)
+		assert (high[psd.index[-1]:] == psd.iloc[-1]).all()
+
+		# Between two bins, inclusive picks the bin above or below to_freq
+		assert psd.high_pad(to_freq=1000.1).index[-1] == 1000.25
+		assert psd.high_pad(to_freq=1000.1, inclusive=False).index[-1] == 1000.0
+
+	def test_pad_without_copy(self):
+		psd = self.make_psd()
+		padded = psd.low_pad(from_freq=30.0, to_freq=psd.index[0], copy=False)
+		assert padded is psd
+		assert (psd[psd.index < 30.0] == psd[30.0]).all()
+
+	def test_pad_psds_to_common_grid(self):
+		from ringdb.PSDClasses import pad_psds
+		psds = {"H1": self.make_psd(), "L1": self.make_psd(f_low=10.0, f_high=300.0, ifo="L1")}
+		padded = pad_psds(psds)
+		assert padded["H1"].index is padded["L1"].index
+		assert padded["H1"].index[0] == 0.0 and padded["H1"].index[-1] == 512.0
+		for ifo, psd in psds.items():
+			assert np.array_equal(padded[ifo][psd.index[0]:psd.index[-1]].values, psd.values)
+			assert (padded[ifo][:psd.index[0]] == psd.iloc[0]).all()
+			assert (padded[ifo][psd.index[-1]:] == psd.iloc[-1]).all()
+
+		with pytest.raises(ValueError):
+			pad_psds({"H1": self.make_psd(), "V1": self.make_psd(f_low=20.1, ifo="V1")})